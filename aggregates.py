@@ -0,0 +1,137 @@
+import pandas as pd
+
+# db
+from sqlalchemy import case, func, literal, union_all
+
+# project specific
+from db import Article, Posting, PostingRating, User
+
+ARTICLE_STATS_DTYPES = {
+    "article_id": "int64",
+    "article_url": "object",
+    "posting_count": "int64",
+    "posting_user_count": "int64",
+    "positive_ratings": "int64",
+    "negative_ratings": "int64",
+    "first_posting_date": "datetime64[ns]",
+    "last_posting_date": "datetime64[ns]",
+    "rating_count": "int64",
+    "rating_user_count": "int64",
+    "interacting_user_count": "int64",
+}
+
+USER_STATS_DTYPES = {
+    "article_id": "int64",
+    "user_id": "int64",
+    "user_name": "object",
+    "posting_count": "int64",
+    "positive_ratings": "int64",
+    "negative_ratings": "int64",
+}
+
+
+def get_typed_frame(rows, dtypes):
+    df = pd.DataFrame(rows, columns=list(dtypes))
+    return df.fillna({c: 0 for (c, dtype) in dtypes.items() if dtype == "int64"}).astype(
+        dtypes
+    )
+
+
+def get_interactions(session, article_ids=None):
+    """
+    Posters and raters of articles in one union of (article_id, user_id, is_rating) rows,
+    a row per posting and per rating.
+    """
+    posting_users = session.query(
+        Posting.article_id.label("article_id"),
+        Posting.user_id.label("user_id"),
+        literal(0).label("is_rating"),
+    )
+    rating_users = session.query(
+        Posting.article_id, PostingRating.user_id, literal(1)
+    ).filter(PostingRating.posting_id == Posting.posting_id)
+    if article_ids is not None:
+        posting_users = posting_users.filter(Posting.article_id.in_(article_ids))
+        rating_users = rating_users.filter(Posting.article_id.in_(article_ids))
+    return union_all(posting_users, rating_users).alias("interactions")
+
+
+def get_article_stats(session, article_ids=None):
+    """
+    Posting, rating and user counts of all articles in two grouped queries.
+    interacting_user_count counts users who posted or rated at least once in an article.
+    """
+    posting_query = session.query(
+        Posting.article_id.label("article_id"),
+        func.count(Posting.posting_id).label("posting_count"),
+        func.count(func.distinct(Posting.user_id)).label("posting_user_count"),
+        func.sum(Posting.positive_rating).label("positive_ratings"),
+        func.sum(Posting.negative_rating).label("negative_ratings"),
+        func.min(Posting.posting_date).label("first_posting_date"),
+        func.max(Posting.posting_date).label("last_posting_date"),
+    ).group_by(Posting.article_id)
+    if article_ids is not None:
+        posting_query = posting_query.filter(Posting.article_id.in_(article_ids))
+    posting_counts = posting_query.subquery()
+    # articles without postings are kept with zero counts
+    article_query = session.query(
+        Article.article_id, Article.article_url, *list(posting_counts.c)[1:]
+    ).outerjoin(posting_counts, posting_counts.c.article_id == Article.article_id).order_by(
+        Article.article_id
+    )
+    if article_ids is not None:
+        article_query = article_query.filter(Article.article_id.in_(article_ids))
+    posting_stats = pd.DataFrame(
+        article_query.all(), columns=list(ARTICLE_STATS_DTYPES)[:8]
+    )
+
+    # posters and raters in one stream, so distinct users are counted in the same pass
+    interactions = get_interactions(session, article_ids)
+    interaction_stats = get_typed_frame(
+        session.query(
+            interactions.c.article_id,
+            func.sum(interactions.c.is_rating),
+            func.count(
+                func.distinct(
+                    case([(interactions.c.is_rating == 1, interactions.c.user_id)])
+                )
+            ),
+            func.count(func.distinct(interactions.c.user_id)),
+        )
+        .group_by(interactions.c.article_id)
+        .all(),
+        {
+            "article_id": "int64",
+            "rating_count": "int64",
+            "rating_user_count": "int64",
+            "interacting_user_count": "int64",
+        },
+    )
+
+    return get_typed_frame(
+        posting_stats.merge(interaction_stats, on="article_id", how="left"),
+        ARTICLE_STATS_DTYPES,
+    )
+
+
+def get_user_stats(session, article_ids=None):
+    """
+    Posting count and received ratings per article and user in one grouped query.
+    """
+    query = (
+        session.query(
+            Posting.article_id,
+            User.user_id,
+            User.user_name,
+            func.count(Posting.posting_id),
+            func.sum(Posting.positive_rating),
+            func.sum(Posting.negative_rating),
+        )
+        .filter(Posting.user_id == User.user_id)
+        .filter(User.user_name != "")
+        .group_by(Posting.article_id, User.user_id)
+        .order_by(Posting.article_id, func.count(Posting.posting_id).desc())
+    )
+    if article_ids is not None:
+        query = query.filter(Posting.article_id.in_(article_ids))
+    return get_typed_frame(query.all(), USER_STATS_DTYPES)
@@ -0,0 +1,494 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+# db
+from sqlalchemy import func
+
+# project specific
+from db import get_db_session, Article, Posting, PostingRating, User
+from logging_setup import FORMAT
+from metrics import get_peak_memory_mb
+from synthetic import create_synthetic_db
+
+# arguments
+parser = argparse.ArgumentParser(
+    description="time crawl persistence, statistics and sentiment stages on a synthetic database"
+)
+parser.add_argument(
+    "--db", help="path of the synthetic database", default="benchmark.db"
+)
+parser.add_argument("--articles", help="number of articles", type=int, default=50)
+parser.add_argument("--users", help="number of users", type=int, default=20000)
+parser.add_argument("--postings", help="number of postings", type=int, default=200000)
+parser.add_argument(
+    "--ratings", help="average ratings per posting", type=float, default=3.0
+)
+parser.add_argument(
+    "--reply-depth", help="max depth of reply threads", type=int, default=5
+)
+parser.add_argument(
+    "--reply-share", help="share of postings replying to another one", type=float, default=0.4
+)
+parser.add_argument("--seed", help="random seed", type=int, default=42)
+parser.add_argument(
+    "--crawl-postings",
+    help="postings written through the crawler's persistence",
+    type=int,
+    default=2000,
+)
+parser.add_argument(
+    "--processes", help="number of worker processes", type=int, default=os.cpu_count()
+)
+parser.add_argument(
+    "--stage", help="only run these stages", action="append", default=None
+)
+parser.add_argument(
+    "--nlp", help="also run stages loading spaCy", action="store_true"
+)
+parser.add_argument(
+    "--baseline", help="baseline file to compare with", default="benchmark_baseline.json"
+)
+parser.add_argument(
+    "--save-baseline", help="store results as new baseline", action="store_true"
+)
+parser.add_argument(
+    "--timeout", help="max seconds per stage", type=float, default=3600
+)
+parser.add_argument(
+    "--tolerance",
+    help="allowed relative slowdown or memory increase compared to the baseline",
+    type=float,
+    default=0.25,
+)
+
+
+def get_posting_stats_per_article(session, article_id):
+    # the former statistics.get_posting_stats, five queries per article
+    user_stats = [
+        (x[0], x[1], x[2], x[3])
+        for x in session.query(
+            User.user_name,
+            func.count(Posting.user_id),
+            func.sum(Posting.positive_rating),
+            func.sum(Posting.negative_rating),
+        )
+        .filter(Posting.user_id == User.user_id)
+        .filter(User.user_name != "")
+        .filter(Posting.article_id == article_id)
+        .group_by(Posting.user_id)
+        .order_by(func.count(Posting.user_id).desc())
+    ]
+    user_ids = [
+        x[0]
+        for x in session.query(Posting.user_id).filter(Posting.article_id == article_id)
+    ]
+    user_ids += [
+        x[0]
+        for x in session.query(PostingRating.user_id, Posting.posting_id)
+        .filter(PostingRating.posting_id == Posting.posting_id)
+        .filter(Posting.article_id == article_id)
+    ]
+    positive_ratings = (
+        session.query(func.sum(Posting.positive_rating))
+        .filter(Posting.article_id == article_id)
+        .first()[0]
+    )
+    negative_ratings = (
+        session.query(func.sum(Posting.negative_rating))
+        .filter(Posting.article_id == article_id)
+        .first()[0]
+    )
+    return user_stats, len(set(user_ids)), positive_ratings, negative_ratings
+
+
+def get_posting_count(session):
+    return session.query(func.count(Posting.posting_id)).scalar()
+
+
+def prepare_crawl_persistence(session, args):
+    # inputs are read from the synthetic database before timing, so only writes are measured
+    crawl_db = os.path.splitext(args.db)[0] + "_crawl.db"
+    if os.path.exists(crawl_db):
+        os.remove(crawl_db)
+    articles = {
+        article.article_id: (
+            article.article_title,
+            article.article_url,
+            article.article_publication_date,
+        )
+        for article in session.query(Article)
+    }
+    postings = (
+        session.query(Posting, User)
+        .filter(Posting.user_id == User.user_id)
+        .order_by(Posting.posting_id)
+        .limit(args.crawl_postings)
+        .all()
+    )
+    rating_lists = {posting.posting_id: [] for (posting, _) in postings}
+    for (posting_id, user_name, verified, positive) in (
+        session.query(
+            PostingRating.posting_id, User.user_name, User.verified, PostingRating.positive
+        )
+        .filter(PostingRating.user_id == User.user_id)
+        .filter(PostingRating.posting_id <= max(rating_lists, default=0))
+    ):
+        if posting_id in rating_lists:
+            rating_lists[posting_id].append((user_name, verified, positive))
+    return (crawl_db, articles, postings, rating_lists)
+
+
+def bench_crawl_persistence(session, args, prepared):
+    import crawl
+
+    crawl.logger.setLevel(logging.WARNING)
+    (crawl_db, articles, postings, rating_lists) = prepared
+    crawl_session = get_db_session(db_url=f"sqlite:///{crawl_db}")
+    crawl_articles = {}
+    for (posting, user) in postings:
+        if posting.article_id not in crawl_articles:
+            crawl_articles[posting.article_id] = Article(*articles[posting.article_id])
+            crawl_session.add(crawl_articles[posting.article_id])
+            crawl_session.commit()
+        crawl.save_posting(
+            crawl_session,
+            crawl_articles[posting.article_id],
+            posting.posting_ref_id,
+            user.user_name,
+            user.verified,
+            user.user_organization,
+            user.supporter,
+            user.follower_count,
+            posting.parent_posting_ref_id,
+            posting.posting_date,
+            posting.negative_rating,
+            posting.positive_rating,
+            posting.posting_title,
+            posting.posting_content,
+            rating_lists[posting.posting_id],
+        )
+    crawl_session.close()
+    return len(postings)
+
+
+def prepare_crawl_logging(session, args):
+    (_, _, postings, rating_lists) = prepare_crawl_persistence(session, args)
+    return (postings, rating_lists)
+
+
+def log_posting(logger, posting, user, rating_list, eager):
+    # replays the crawler's log calls for one posting, eager as before the shared logging setup
+    if eager:
+        logger.debug(f"User name found: {user.user_name}")
+        logger.debug(f"User {user.user_name} is verified.")
+        logger.debug(f"User {user.user_name} added no organization information.")
+        logger.debug(f"User {user.user_name} is no supporter.")
+        logger.debug(f"User {user.user_name} has {user.follower_count} followers.")
+        logger.debug(f"Posting is a reply to posting with id: {posting.parent_posting_ref_id}.")
+        logger.debug(f"Posting date is {posting.posting_date}.")
+        logger.debug(f"Posting's negative rating count is {posting.negative_rating}.")
+        logger.debug(f"Posting's positive rating count is {posting.positive_rating}.")
+        logger.debug(f"Posting title is {posting.posting_title}.")
+        logger.debug(f"Posting content is {posting.posting_content}.")
+        for (user_name, verified, positive) in rating_list:
+            logger.debug(f"User {user_name} rated posting.")
+            logger.debug(f"Posting was rated positive by {user_name}.")
+            logger.debug(f"User {user_name} is verified.")
+        logger.info(f"Updated User: {user}")
+        logger.info(f"Added new Posting: {posting}")
+        for rating in rating_list:
+            logger.info(f"Added new PostingRating: {rating}")
+    else:
+        logger.debug("User name found: %s", user.user_name)
+        logger.debug("User %s is verified.", user.user_name)
+        logger.debug("User %s added no organization information.", user.user_name)
+        logger.debug("User %s is no supporter.", user.user_name)
+        logger.debug("User %s has %s followers.", user.user_name, user.follower_count)
+        logger.debug(
+            "Posting is a reply to posting with id: %s.", posting.parent_posting_ref_id
+        )
+        logger.debug("Posting date is %s.", posting.posting_date)
+        logger.debug("Posting's negative rating count is %s.", posting.negative_rating)
+        logger.debug("Posting's positive rating count is %s.", posting.positive_rating)
+        logger.debug("Posting title is %s.", posting.posting_title)
+        logger.debug("Posting content is %s.", posting.posting_content)
+        for (user_name, verified, positive) in rating_list:
+            logger.debug("User %s rated posting.", user_name)
+            logger.debug("Posting was rated positive by %s.", user_name)
+            logger.debug("User %s is verified.", user_name)
+        logger.info("%s User: %s", "Updated", user)
+        logger.info("%s Posting: %s", "Added new", posting)
+        for rating in rating_list:
+            logger.info("%s PostingRating: %s", "Added new", rating)
+
+
+def bench_crawl_logging_sync(session, args, prepared):
+    # the former per script setup, file and console written in the crawling thread
+    logging.basicConfig(
+        filename=os.path.join("log", "benchmark_crawl_logging_sync.log"),
+        format=FORMAT,
+        level=20,
+    )
+    logger = logging.getLogger("postings")
+    ch = logging.StreamHandler(open(os.devnull, "w"))
+    ch.setFormatter(logging.Formatter(FORMAT))
+    logger.addHandler(ch)
+    (postings, rating_lists) = prepared
+    for (posting, user) in postings:
+        log_posting(logger, posting, user, rating_lists[posting.posting_id], eager=True)
+    return len(postings)
+
+
+def bench_crawl_logging(session, args, prepared):
+    # only the crawling thread is timed, the listener writes the records in the background
+    import logging_setup
+
+    logger = logging_setup.setup_logging("postings", "benchmark_crawl_logging")
+    for handler in logging_setup.listener.handlers:
+        if not isinstance(handler, logging.FileHandler):
+            handler.setStream(open(os.devnull, "w"))
+    (postings, rating_lists) = prepared
+    for (posting, user) in postings:
+        log_posting(logger, posting, user, rating_lists[posting.posting_id], eager=False)
+    return len(postings)
+
+
+def bench_posting_stats_per_article(session, args, prepared=None):
+    for (article_id,) in session.query(Article.article_id):
+        get_posting_stats_per_article(session, article_id)
+    return get_posting_count(session)
+
+
+def bench_aggregates(session, args, prepared=None):
+    from aggregates import get_article_stats, get_user_stats
+
+    get_article_stats(session)
+    get_user_stats(session)
+    return get_posting_count(session)
+
+
+def bench_overlap(session, args, prepared=None):
+    from overlap import get_audience_overlap
+
+    get_audience_overlap(session)
+    return get_posting_count(session)
+
+
+def bench_timeseries(session, args, prepared=None):
+    from timeseries import get_posting_rate, get_posting_time_summary
+
+    get_posting_time_summary(session)
+    get_posting_rate(session, resolution="minute")
+    get_posting_rate(session, resolution="hour", since_publication=True)
+    return get_posting_count(session)
+
+
+def bench_summaries(session, args, prepared=None):
+    from summaries import refresh_summaries
+
+    (postings, _) = refresh_summaries(session, full=True)
+    return postings
+
+
+def bench_sentiment_train(session, args, prepared=None):
+    import sentiment
+
+    sentiment.logger.setLevel(logging.WARNING)
+    model_path = os.path.splitext(args.db)[0] + "_sentiment.joblib"
+    sentiment.train_classifier(session, model_path, epochs=1)
+    return get_posting_count(session)
+
+
+def prepare_sentiment_predict(session, args):
+    import sentiment
+
+    sentiment.logger.setLevel(logging.WARNING)
+    model_path = os.path.splitext(args.db)[0] + "_sentiment.joblib"
+    # the database is regenerated for every run, so don't rely on a model of an earlier one
+    if "sentiment_train" not in get_stage_names(args):
+        sentiment.train_classifier(session, model_path, epochs=1)
+    return model_path
+
+
+def bench_sentiment_predict(session, args, prepared=None):
+    import sentiment
+
+    sentiment.logger.setLevel(logging.WARNING)
+    return sentiment.predict_postings(session, prepared, processes=args.processes)
+
+
+def bench_entity_index(session, args, prepared=None):
+    from entity_index import clear_index, update_index
+    from nlp_pipeline import load_nlp
+
+    nlp = load_nlp()
+    clear_index(session)
+    return update_index(session, nlp)
+
+
+def bench_entities(session, args, prepared=None):
+    import statistics
+    from nlp_pipeline import load_nlp
+
+    statistics.logger.setLevel(logging.WARNING)
+    with statistics.entity_pool(session, args.processes) as pool:
+        nlp = load_nlp() if pool is None else None
+        for (article_id,) in session.query(Article.article_id):
+            statistics.get_posting_entities(session, nlp, article_id, pool=pool)
+    return get_posting_count(session)
+
+
+# stage name, untimed preparation, timed function and whether it loads spaCy, in order of execution
+STAGES = [
+    ("crawl_persistence", prepare_crawl_persistence, bench_crawl_persistence, False),
+    ("crawl_logging_sync", prepare_crawl_logging, bench_crawl_logging_sync, False),
+    ("crawl_logging", prepare_crawl_logging, bench_crawl_logging, False),
+    ("posting_stats_per_article", None, bench_posting_stats_per_article, False),
+    ("aggregates", None, bench_aggregates, False),
+    ("overlap", None, bench_overlap, False),
+    ("timeseries", None, bench_timeseries, False),
+    ("summaries", None, bench_summaries, False),
+    ("sentiment_train", None, bench_sentiment_train, False),
+    ("sentiment_predict", prepare_sentiment_predict, bench_sentiment_predict, False),
+    ("entity_index", None, bench_entity_index, True),
+    ("entities", None, bench_entities, True),
+]
+
+
+def get_stage_names(args):
+    return [
+        name
+        for (name, _, _, uses_nlp) in STAGES
+        if (not args.stage or name in args.stage) and (args.nlp or not uses_nlp)
+    ]
+
+
+def run_stage(prepare, stage, args, results):
+    # runs in a fresh process, so peak memory belongs to this stage only
+    try:
+        session = get_db_session(db_url=f"sqlite:///{args.db}")
+        prepared = prepare(session, args) if prepare else None
+        t1 = time.perf_counter()
+        items = stage(session, args, prepared)
+        seconds = time.perf_counter() - t1
+        session.close()
+        results.put(
+            {
+                "seconds": round(seconds, 3),
+                "items": items,
+                "throughput": round(items / seconds, 1) if seconds else None,
+                "peak_memory_mb": round(get_peak_memory_mb(), 1),
+            }
+        )
+    except BaseException as ex:
+        # the parent waits for exactly one result per stage
+        results.put({"error": repr(ex)})
+        raise
+
+
+def run_benchmark(args):
+    os.makedirs("log", exist_ok=True)
+    config = {
+        "articles": args.articles,
+        "users": args.users,
+        "postings": args.postings,
+        "ratings": args.ratings,
+        "reply_depth": args.reply_depth,
+        "reply_share": args.reply_share,
+        "seed": args.seed,
+        "crawl_postings": args.crawl_postings,
+    }
+    t1 = time.perf_counter()
+    create_synthetic_db(
+        args.db,
+        args.articles,
+        args.users,
+        args.postings,
+        args.ratings,
+        args.reply_depth,
+        args.reply_share,
+        seed=args.seed,
+        force=True,
+    ).close()
+    stages = {
+        "generate": {
+            "seconds": round(time.perf_counter() - t1, 3),
+            "items": args.postings,
+            "throughput": round(args.postings / (time.perf_counter() - t1), 1),
+            "peak_memory_mb": round(get_peak_memory_mb(), 1),
+        }
+    }
+    print(f"{'stage':<28}{'seconds':>10}{'items/s':>12}{'peak MB':>10}")
+    print(f"{'generate':<28}{stages['generate']['seconds']:>10}{stages['generate']['throughput']:>12}{stages['generate']['peak_memory_mb']:>10}")
+    stage_names = get_stage_names(args)
+    for (name, prepare, stage, _) in STAGES:
+        if name not in stage_names:
+            continue
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=run_stage, args=(prepare, stage, args, results)
+        )
+        process.start()
+        try:
+            result = results.get(timeout=args.timeout)
+        except queue.Empty:
+            process.terminate()
+            result = {"error": f"no result within {args.timeout}s"}
+        process.join()
+        if "error" not in result and process.exitcode:
+            result = {"error": f"exit code {process.exitcode}"}
+        if "error" in result:
+            print(f"{name:<28}failed: {result['error']}")
+            return {"config": config, "stages": stages, "failed": name}
+        stages[name] = result
+        print(f"{name:<28}{result['seconds']:>10}{result['throughput']:>12}{result['peak_memory_mb']:>10}")
+    return {"config": config, "stages": stages}
+
+
+def compare_with_baseline(run, baseline, tolerance):
+    """
+    Return a message for every stage that got slower or needs more memory than allowed by tolerance.
+    """
+    regressions = []
+    for (name, result) in run["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+        for metric in ["seconds", "peak_memory_mb"]:
+            before = baseline["stages"][name][metric]
+            if before and result[metric] > before * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {metric} increased from {before} to {result[metric]}"
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    run = run_benchmark(args)
+    if "failed" in run:
+        sys.exit(f"Stage {run['failed']} failed.")
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Saved baseline to {args.baseline}.")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] != run["config"]:
+            # results of another configuration aren't comparable, that's no pass
+            sys.exit(
+                f"{args.baseline} was recorded with a different configuration: "
+                f"{baseline['config']}, use --save-baseline to replace it."
+            )
+        regressions = compare_with_baseline(run, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions compared to {args.baseline}.")
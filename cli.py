@@ -0,0 +1,286 @@
+import time
+
+START = time.perf_counter()
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import resource
+
+# project specific
+from crawl_arguments import add_crawl_arguments
+import metrics
+from sentiment_arguments import (
+    add_entities_arguments,
+    add_predict_arguments,
+    add_train_arguments,
+)
+from statistics_arguments import add_stats_subparsers
+
+# arguments
+parser = argparse.ArgumentParser(
+    description="crawl derstandard.at postings, get statistics and sentiments"
+)
+parser.add_argument("--verbose", help="increase output verbosity", action="store_true")
+metrics.add_metrics_arguments(parser)
+subparsers = parser.add_subparsers(dest="command")
+subparsers.required = True
+
+crawl_parser = subparsers.add_parser("crawl", help="crawl postings")
+add_crawl_arguments(crawl_parser)
+
+stats_parser = subparsers.add_parser("stats", help="posting statistics")
+stats_subparsers = add_stats_subparsers(stats_parser)
+stats_subparsers.required = True
+
+sentiment_parser = subparsers.add_parser("sentiment", help="sentiment analysis")
+sentiment_subparsers = sentiment_parser.add_subparsers(dest="sentiment_command")
+sentiment_subparsers.required = True
+sentiment_entities_parser = sentiment_subparsers.add_parser(
+    "entities", help="entity sentiments based on SentiWS (loads spaCy)"
+)
+add_entities_arguments(sentiment_entities_parser)
+train_parser = sentiment_subparsers.add_parser(
+    "train", help="train classifier using posting ratings as labels"
+)
+add_train_arguments(train_parser)
+predict_parser = sentiment_subparsers.add_parser(
+    "predict", help="classify all postings with a trained model"
+)
+add_predict_arguments(predict_parser)
+
+index_parser = subparsers.add_parser("index", help="inverted entity index")
+index_subparsers = index_parser.add_subparsers(dest="index_command")
+index_subparsers.required = True
+update_parser = index_subparsers.add_parser(
+    "update", help="add entities of new postings to the index (loads spaCy)"
+)
+update_parser.add_argument(
+    "--chunk-size", help="postings per committed chunk", type=int, default=1000
+)
+update_parser.add_argument(
+    "--rebuild", help="clear the index before updating", action="store_true"
+)
+postings_parser = index_subparsers.add_parser(
+    "postings", help="postings mentioning an entity"
+)
+postings_parser.add_argument("entity", help="entity text")
+postings_parser.add_argument("--label", help="entity label, e.g. ORG", default=None)
+postings_parser.add_argument(
+    "--article", help="only article with this id", type=int, default=None
+)
+top_parser = index_subparsers.add_parser("top", help="top entities per article")
+top_parser.add_argument(
+    "--article", help="only article with this id", type=int, default=None
+)
+top_parser.add_argument("--label", help="entity label, e.g. ORG", default=None)
+top_parser.add_argument(
+    "--limit", help="number of entities per article", type=int, default=30
+)
+cooccurring_parser = index_subparsers.add_parser(
+    "cooccurring", help="entities mentioned in the same postings"
+)
+cooccurring_parser.add_argument("entity", help="entity text")
+cooccurring_parser.add_argument("--label", help="entity label, e.g. ORG", default=None)
+cooccurring_parser.add_argument(
+    "--article", help="only article with this id", type=int, default=None
+)
+cooccurring_parser.add_argument(
+    "--limit", help="number of entities", type=int, default=30
+)
+
+logger = logging.getLogger("cli")
+
+# seconds since start, recorded once a stage has imported its modules and loaded its models
+timings = {}
+
+
+def checkpoint(name):
+    timings[name] = time.perf_counter() - START
+
+
+def run_crawl(args):
+    import crawl
+
+    if args.verbose:
+        crawl.logger.setLevel(10)
+    checkpoint("startup")
+    crawl.crawl(args)
+
+
+def run_stats(args):
+    import statistics
+    from db import get_db_session, Article
+
+    if args.verbose:
+        statistics.logger.setLevel(10)
+    session = get_db_session(args.verbose)
+    if args.stats_command != "entities":
+        checkpoint("startup")
+
+    if args.stats_command == "refresh":
+        (postings, ratings) = statistics.refresh_summaries(session, args.full)
+        statistics.logger.info(
+            f"Added {postings} postings and {ratings} ratings to the summaries."
+        )
+    elif args.stats_command == "summary":
+        statistics.get_summary_stats(session, refresh=False, limit=args.limit)
+    elif args.stats_command == "time":
+        statistics.get_time_stats(
+            session, args.article, args.resolution, args.since_publication
+        )
+    elif args.stats_command == "users":
+        statistics.get_posting_stats(session, args.article)
+    elif args.stats_command == "overlap":
+        statistics.get_overlap_stats(session, args.output, args.article)
+    else:
+        from nlp_pipeline import load_nlp
+
+        articles = session.query(Article)
+        if args.article is not None:
+            articles = articles.filter(Article.article_id.in_(args.article))
+        with statistics.entity_pool(session, args.processes) as pool:
+            nlp = load_nlp()
+            checkpoint("startup")
+            for article in articles:
+                statistics.logger.info(
+                    f"Getting stats for article: {article.article_url}"
+                )
+                statistics.get_posting_entities(
+                    session, nlp, article.article_id, args.limit, pool
+                )
+    session.close()
+
+
+def run_sentiment(args):
+    import sentiment
+    from db import get_db_session
+
+    if args.verbose:
+        sentiment.logger.setLevel(10)
+    session = get_db_session(args.verbose)
+    if args.sentiment_command == "train":
+        checkpoint("startup")
+        sentiment.train_classifier(
+            session,
+            args.model,
+            args.chunk_size,
+            args.epochs,
+            args.min_ratings,
+            args.test_share,
+        )
+    elif args.sentiment_command == "predict":
+        checkpoint("startup")
+        sentiment.predict_postings(
+            session, args.model, args.chunk_size, args.processes
+        )
+    else:
+        from nlp_pipeline import load_nlp
+
+        nlp = load_nlp(sentiws_path="sentiws/")
+        checkpoint("startup")
+        sentiment.get_entity_sentiments(session, nlp, args.entities or ["fpö"])
+    session.close()
+
+
+def run_index(args):
+    import entity_index
+    from db import get_db_session, Article
+    from logging_setup import setup_logging
+
+    # entity_index has no script of its own, which would set up logging on import
+    index_logger = setup_logging("entity_index", verbose=args.verbose)
+    session = get_db_session(args.verbose)
+    if args.index_command == "update":
+        from nlp_pipeline import load_nlp
+
+        nlp = load_nlp()
+        checkpoint("startup")
+        if args.rebuild:
+            entity_index.clear_index(session)
+        entity_index.update_index(session, nlp, args.chunk_size)
+    elif args.index_command == "postings":
+        checkpoint("startup")
+        postings = entity_index.find_postings(
+            session, args.entity, args.label, args.article
+        )
+        index_logger.info(f"{len(postings)} postings mention {args.entity}.")
+        for (posting_id, article_id, mention_count) in postings:
+            index_logger.info(f"{posting_id} {article_id} {mention_count}")
+    elif args.index_command == "top":
+        checkpoint("startup")
+        articles = session.query(Article)
+        if args.article is not None:
+            articles = articles.filter(Article.article_id == args.article)
+        for article in articles:
+            index_logger.info(f"Top entities for article: {article.article_url}")
+            for (entity_text, entity_label, posting_count, mention_count) in (
+                entity_index.top_entities(
+                    session, article.article_id, args.limit, args.label
+                )
+            ):
+                index_logger.info(
+                    f"{entity_text} {entity_label} {posting_count} {mention_count}"
+                )
+    else:
+        checkpoint("startup")
+        index_logger.info(f"Entities mentioned together with {args.entity}:")
+        for (entity_text, entity_label, posting_count) in (
+            entity_index.co_occurring_entities(
+                session, args.entity, args.label, args.article, args.limit
+            )
+        ):
+            index_logger.info(f"{entity_text} {entity_label} {posting_count}")
+    session.close()
+
+
+def record_run(command):
+    checkpoint("total")
+    run = {
+        "date": datetime.datetime.now().isoformat(),
+        "command": command,
+        "startup_seconds": round(timings.get("startup", timings["total"]), 3),
+        "total_seconds": round(timings["total"], 3),
+        "peak_memory_mb": round(metrics.get_peak_memory_mb(), 1),
+        "peak_children_memory_mb": round(
+            metrics.get_peak_memory_mb(resource.RUSAGE_CHILDREN), 1
+        ),
+    }
+    logger.info(
+        f"{command}: startup took {run['startup_seconds']}s, "
+        f"total {run['total_seconds']}s, peak memory {run['peak_memory_mb']}MB."
+    )
+    os.makedirs("log", exist_ok=True)
+    with open("log/cli_runs.jsonl", "a") as f:
+        f.write(json.dumps(run) + "\n")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    command = " ".join(
+        c
+        for c in [
+            args.command,
+            getattr(args, "stats_command", None),
+            getattr(args, "sentiment_command", None),
+            getattr(args, "index_command", None),
+        ]
+        if c
+    )
+    with metrics.recording(args.metrics, args.profile):
+        if args.command == "crawl":
+            run_crawl(args)
+        elif args.command == "stats":
+            run_stats(args)
+        elif args.command == "index":
+            run_index(args)
+        else:
+            run_sentiment(args)
+
+    # the stage modules set up logging with their own log file, so log the run record afterwards
+    from logging_setup import setup_logging
+
+    setup_logging("cli")
+    record_run(command)
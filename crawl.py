@@ -1,8 +1,6 @@
 import argparse
 import datetime
 import locale
-import logging
-import time
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -10,42 +8,24 @@ from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.action_chains import ActionChains
 
 # db
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import func
 
-from db import Base, Article, Posting, PostingRating, User
-
-# set german locale for accurate datetime parsing
-locale.setlocale(locale.LC_TIME, "de_AT")
+from crawl_arguments import add_crawl_arguments
+from db import get_db_session, Article, Posting, PostingRating, User, DELETED_USER
+from logging_setup import setup_logging, RateLimitFilter, RATE_LIMITED
+import metrics
+from summaries import refresh_summaries
 
 # arguments
 parser = argparse.ArgumentParser()
-parser.add_argument(
-    "--continue-article", help="continue crawling with article", type=int, default=0
-)
-parser.add_argument("--retries", help="max retries per article", type=int, default=10)
+add_crawl_arguments(parser)
 parser.add_argument("--verbose", help="increase output verbosity", action="store_true")
-parser.add_argument(
-    "--no-headless", help="don't run chrome headless", action="store_false"
-)
+metrics.add_metrics_arguments(parser)
 
 # logging
-FORMAT = "%(asctime)-15s %(levelname)s %(message)s"
-logging.basicConfig(filename=f"log/{datetime.datetime.now()}_standard_postings.log", format=FORMAT, level=20)
-logger = logging.getLogger("postings")
-
-# create console handler and set level to debug
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-
-# create formatter
-formatter = logging.Formatter(FORMAT)
-
-# add formatter to ch
-ch.setFormatter(formatter)
-
-# add ch to logger
-logger.addHandler(ch)
+logger = setup_logging("postings", "standard_postings")
+# missing follower or rating counts repeat for many postings in a row
+logger.addFilter(RateLimitFilter())
 
 # urls to crawl
 url_list = [
@@ -68,13 +48,6 @@ def setup_webdriver(run_headless=True):
     )
 
 
-def get_db_session(echo=False):
-    engine = create_engine("sqlite:///postings.db", encoding="utf-8", echo=echo)
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session()
-
-
 def accept_cookies():
     try:
         # check if privacywall pops up
@@ -102,10 +75,10 @@ def get_last_crawled_posting_id_for_article(article_id):
         .filter(Posting.article_id == article_id)
         .first()[0]
     )
-    logger.info(f"last posting id: {last_posting_id}")
+    logger.info("last posting id: %s", last_posting_id)
     if last_posting_id:
         last_posting_ref_id = session.query(Posting).get(last_posting_id).posting_ref_id
-        logger.info(f"last posting ref id: {last_posting_ref_id}")
+        logger.info("last posting ref id: %s", last_posting_ref_id)
         return last_posting_ref_id
     return None
 
@@ -116,15 +89,19 @@ def go_to_page_with_posting_id(posting_ref_id, page_count):
             driver.find_element_by_css_selector(
                 f"div#postinglist div.posting[data-postingid='{posting_ref_id}']"
             )
-            logger.info(f"Found posting with id {posting_ref_id} on page {page_count}")
+            logger.info(
+                "Found posting with id %s on page %s", posting_ref_id, page_count
+            )
             break  # found page including last posting id
         except NoSuchElementException:
             logger.debug(
-                f"Couldn't find posting with id {posting_ref_id} on page {page_count}"
+                "Couldn't find posting with id %s on page %s",
+                posting_ref_id,
+                page_count,
             )
             page_count += 1
             driver.find_element_by_class_name("forum-tb-btnnext").click()
-            time.sleep(3)
+            metrics.sleep(3, reason="page")
     return page_count
 
 
@@ -133,34 +110,34 @@ def get_posting_user_data():
         user_name = posting.find_element_by_css_selector(
             "a.upost-usercontainer strong.upost-communityname"
         ).text
-        logger.debug(f"User name found: {user_name}")
+        logger.debug("User name found: %s", user_name)
     except NoSuchElementException:  # deleted user
         logger.debug("No user name found, assuming user was deleted.")
-        user_name = "<DELETED USER>"
+        user_name = DELETED_USER
 
     try:
         posting.find_element_by_css_selector("span.upost-verified-identity")
-        logger.debug(f"User {user_name} is verified.")
+        logger.debug("User %s is verified.", user_name)
         verified = True
     except NoSuchElementException:
-        logger.debug(f"User {user_name} is not verified.")
+        logger.debug("User %s is not verified.", user_name)
         verified = False
 
     try:
         user_organization = posting.find_element_by_css_selector(
             "span.upost-organization-identity"
         ).text
-        logger.debug(f"User {user_name} added organization information.")
+        logger.debug("User %s added organization information.", user_name)
     except NoSuchElementException:
-        logger.debug(f"User {user_name} added no organization information.")
+        logger.debug("User %s added no organization information.", user_name)
         user_organization = None
 
     try:
         posting.find_element_by_css_selector("span.upost-supporter")
-        logger.debug(f"User {user_name} is a supporter.")
+        logger.debug("User %s is a supporter.", user_name)
         supporter = True
     except NoSuchElementException:
-        logger.debug(f"User {user_name} is no supporter.")
+        logger.debug("User %s is no supporter.", user_name)
         supporter = False
 
     try:
@@ -168,11 +145,15 @@ def get_posting_user_data():
             "span.upost-follower"
         ).text
         follower_count = int(follower_count)
-        logger.debug(f"User {user_name} has {follower_count} followers.")
+        logger.debug("User %s has %s followers.", user_name, follower_count)
     except (NoSuchElementException, ValueError) as ex:
         follower_count = 0
         logger.warning(
-            f"Couldn't detect follower count, assuming user {user_name} has {follower_count} followers. Exception was: {ex}"
+            "Couldn't detect follower count, assuming user %s has %s followers. Exception was: %s",
+            user_name,
+            follower_count,
+            ex,
+            extra=RATE_LIMITED,
         )
 
     return user_name, verified, user_organization, supporter, follower_count
@@ -181,7 +162,9 @@ def get_posting_user_data():
 def get_posting_data():
     try:
         parent_posting_ref_id = posting.get_attribute("data-parentpostingid")
-        logger.debug(f"Posting is a reply to posting with id: {parent_posting_ref_id}.")
+        logger.debug(
+            "Posting is a reply to posting with id: %s.", parent_posting_ref_id
+        )
     except TypeError:
         parent_posting_ref_id = None
 
@@ -189,7 +172,7 @@ def get_posting_data():
         posting.find_element_by_css_selector("span.js-timestamp").text.strip(),
         "%d. %B %Y, %H:%M:%S",
     )
-    logger.debug(f"Posting date is {posting_date}.")
+    logger.debug("Posting date is %s.", posting_date)
 
     try:
         negative_rating_count = posting.find_element_by_css_selector(
@@ -198,11 +181,13 @@ def get_posting_data():
         negative_rating_count = (
             int(negative_rating_count) if len(negative_rating_count) else 0
         )
-        logger.debug(f"Posting's negative rating count is {negative_rating_count}.")
+        logger.debug("Posting's negative rating count is %s.", negative_rating_count)
     except (NoSuchElementException, ValueError) as ex:
         negative_rating_count = 0
         logger.warning(
-            f"Couldn't detect posting's negative rating count, assuming is is 0. Exception was: {ex}"
+            "Couldn't detect posting's negative rating count, assuming is is 0. Exception was: %s",
+            ex,
+            extra=RATE_LIMITED,
         )
 
     try:
@@ -212,21 +197,23 @@ def get_posting_data():
         positive_rating_count = (
             int(positive_rating_count) if len(positive_rating_count) else 0
         )
-        logger.debug(f"Posting's positive rating count is {positive_rating_count}.")
+        logger.debug("Posting's positive rating count is %s.", positive_rating_count)
     except (NoSuchElementException, ValueError) as ex:
         positive_rating_count = 0
         logger.warning(
-            f"Couldn't detect posting's positive rating count, assuming is is 0. Exception was: {ex}"
+            "Couldn't detect posting's positive rating count, assuming is is 0. Exception was: %s",
+            ex,
+            extra=RATE_LIMITED,
         )
     posting_title = posting.find_element_by_css_selector(
         "div.upost-content div.upost-body h4.upost-title"
     ).text
-    logger.debug(f"Posting title is {posting_title}.")
+    logger.debug("Posting title is %s.", posting_title)
 
     posting_content = posting.find_element_by_css_selector(
         "div.upost-content div.upost-body div.upost-text"
     ).text
-    logger.debug(f"Posting content is {posting_content}.")
+    logger.debug("Posting content is %s.", posting_content)
 
     return (
         parent_posting_ref_id,
@@ -244,12 +231,12 @@ def get_posting_rating_users():
         driver.find_element_by_css_selector("div.js-ratings")
     ).perform()
     posting.find_element_by_css_selector("div.js-ratings").click()
-    time.sleep(3)
+    metrics.sleep(3, reason="ratings")
     # expand user list if necessary
     try:
         while driver.find_element_by_class_name("js-ratings-log-showmore"):
             driver.find_element_by_class_name("js-ratings-log-showmore").click()
-            time.sleep(3)
+            metrics.sleep(3, reason="ratings")
     except NoSuchElementException:
         pass
     rating_list = []
@@ -258,24 +245,24 @@ def get_posting_rating_users():
             rating_user_name = rating.find_element_by_css_selector(
                 "a.ratings-log-communityname"
             ).text
-            logger.debug(f"User {rating_user_name} rated posting.")
+            logger.debug("User %s rated posting.", rating_user_name)
         except NoSuchElementException:
             logger.debug("No user name found, assuming user was deleted.")
-            rating_user_name = "<DELETED USER>"
+            rating_user_name = DELETED_USER
 
         rating_positive = rating.get_attribute("data-rate") == "positive"
         if rating_positive:
-            logger.debug(f"Posting was rated positive by {rating_user_name}.")
+            logger.debug("Posting was rated positive by %s.", rating_user_name)
         else:
-            logger.debug(f"Posting was rated negative by {rating_user_name}.")
+            logger.debug("Posting was rated negative by %s.", rating_user_name)
 
         try:
             rating.find_element_by_css_selector("a.ratings-log-is-byverifieduser")
             rating_user_verified = True
-            logger.debug(f"User {rating_user_name} is verified.")
+            logger.debug("User %s is verified.", rating_user_name)
         except NoSuchElementException:
             rating_user_verified = False
-            logger.debug(f"User {rating_user_name} is not verified.")
+            logger.debug("User %s is not verified.", rating_user_name)
         rating_positive = rating.get_attribute("data-rate") == "positive"
         rating_list.append((rating_user_name, rating_user_verified, rating_positive))
 
@@ -283,21 +270,120 @@ def get_posting_rating_users():
     return rating_list
 
 
-if __name__ == "__main__":
+def save_posting(
+    session,
+    article,
+    posting_ref_id,
+    user_name,
+    verified,
+    user_organization,
+    supporter,
+    follower_count,
+    parent_posting_ref_id,
+    posting_date,
+    negative_rating_count,
+    positive_rating_count,
+    posting_title,
+    posting_content,
+    rating_list,
+):
+    # update database
+    user = session.query(User).filter(User.user_name == user_name).first()
+    if user is None:
+        user = User(
+            user_name,
+            verified,
+            follower_count,
+            user_organization,
+            supporter,
+        )
+        db_statement_info = "Added new"
+    else:
+        user.verified = verified
+        if user.follower_count is None:
+            user.follower_count = follower_count
+        elif follower_count > user.follower_count:
+            # only update follower count if follower count > as current info
+            user.follower_count = follower_count
+        user.user_organization = user_organization
+        user.supporter = supporter
+        db_statement_info = "Updated"
+    session.add(user)
+    session.commit()
+    logger.info("%s User: %s", db_statement_info, user)
+
+    posting = (
+        session.query(Posting).filter(Posting.posting_ref_id == posting_ref_id).first()
+    )
+    if posting is None:
+        posting = Posting(
+            article.article_id,
+            user.user_id,
+            posting_ref_id,
+            parent_posting_ref_id,
+            posting_date,
+            negative_rating_count,
+            positive_rating_count,
+            posting_title,
+            posting_content,
+        )
+        db_statement_info = "Added new"
+    else:
+        posting.parent_posting_ref_id = parent_posting_ref_id
+        posting.posting_date = posting_date
+        posting.negative_rating_count = negative_rating_count
+        posting.positive_rating_count = positive_rating_count
+        posting.posting_title = posting_title
+        posting.posting_content = posting_content
+        db_statement_info = "Updated"
+    session.add(posting)
+    session.commit()
+    logger.info("%s Posting: %s", db_statement_info, posting)
+
+    for (user_name, verified, rating_positive) in rating_list:
+        user = session.query(User).filter(User.user_name == user_name).first()
+        if user is None:
+            user = User(user_name, verified)
+            session.add(user)
+            session.commit()
+            logger.debug("Added new user: %s", user)
+        posting_rating = (
+            session.query(PostingRating)
+            .filter(
+                PostingRating.posting_id == posting.posting_id,
+                PostingRating.user_id == user.user_id,
+            )
+            .first()
+        )
+        if posting_rating is None:
+            posting_rating = PostingRating(rating_positive)
+            posting_rating.posting = posting
+            posting_rating.user = user
+            db_statement_info = "Added new"
+        else:
+            posting_rating.positive = rating_positive
+            db_statement_info = "Updated"
+        session.add(posting_rating)
+        session.commit()
+        logger.info("%s PostingRating: %s", db_statement_info, posting_rating)
+    return posting
+
+
+def crawl(args):
+    global driver, session, posting
     t1 = datetime.datetime.now()
-    args = parser.parse_args()
-    if args.verbose:
-        logger.setLevel(10)
+    # set german locale for accurate datetime parsing
+    locale.setlocale(locale.LC_TIME, "de_AT")
     session = get_db_session(args.verbose)
     logger.info("Established database connection.")
-    driver = setup_webdriver(args.no_headless)
+    driver = metrics.instrument_driver(setup_webdriver(args.no_headless))
     logger.info("Setup webdriver.")
     for url in url_list:
-        logger.info(f"Crawling postings for url: {url}")
+        logger.info("Crawling postings for url: %s", url)
         driver.get(url)
-        time.sleep(3)
+        metrics.sleep(3, reason="page")
         accept_cookies()
-        time.sleep(3)
+        metrics.sleep(3, reason="cookies")
 
         article = session.query(Article).filter(Article.article_url == url).first()
         if article is None:
@@ -314,7 +400,7 @@ if __name__ == "__main__":
         if args.continue_article:
             if article.article_id != args.continue_article:
                 logger.debug(
-                    f"Skipping article {article} with id {article.article_id}."
+                    "Skipping article %s with id %s.", article, article.article_id
                 )
                 continue
             last_posting_ref_id = get_last_crawled_posting_id_for_article(
@@ -322,14 +408,17 @@ if __name__ == "__main__":
             )
             if last_posting_ref_id:
                 page_count = go_to_page_with_posting_id(last_posting_ref_id, page_count)
-                time.sleep(3)
+                metrics.sleep(3, reason="page")
             else:
-                logger.warning(f"Couldn't find a posting for article: {article}")
+                logger.warning("Couldn't find a posting for article: %s", article)
 
         retries = args.retries
         posting_ids = find_posting_ids()
         logger.debug(
-            f"Found {len(posting_ids)} postings with ids: {posting_ids} on page {page_count}."
+            "Found %s postings with ids: %s on page %s.",
+            len(posting_ids),
+            posting_ids,
+            page_count,
         )
         continue_crawling = False
         if len(posting_ids):
@@ -363,109 +452,47 @@ if __name__ == "__main__":
                             rating_list = get_posting_rating_users()
                     except Exception as ex:
                         retries -= 1
+                        metrics.increment("crawl_errors")
                         logger.error(
-                            f"Couldn't process posting with id {posting_ref_id} on page {page_count}. Exception: {ex}. Retries left: {retries}."
+                            "Couldn't process posting with id %s on page %s. Exception: %s. Retries left: %s.",
+                            posting_ref_id,
+                            page_count,
+                            ex,
+                            retries,
                         )
                         if not retries:
                             break
                     else:
                         crawled_posting = True
-                        # update database
-                        user = (
-                            session.query(User)
-                            .filter(User.user_name == user_name)
-                            .first()
-                        )
-                        if user is None:
-                            user = User(
-                                user_name,
-                                verified,
-                                follower_count,
-                                user_organization,
-                                supporter,
-                            )
-                            db_statement_info = "Added new"
-                        else:
-                            user.verified = verified
-                            if user.follower_count is None:
-                                user.follower_count = follower_count
-                            elif follower_count > user.follower_count:
-                                # only update follower count if follower count > as current info
-                                user.follower_count = follower_count
-                            user.user_organization = user_organization
-                            user.supporter = supporter
-                            db_statement_info = "Updated"
-                        session.add(user)
-                        session.commit()
-                        logger.info(f"{db_statement_info} User: {user}")
-
-                        posting = (
-                            session.query(Posting)
-                            .filter(Posting.posting_ref_id == posting_ref_id)
-                            .first()
+                        metrics.increment("crawled_postings")
+                        metrics.increment("crawled_ratings", len(rating_list))
+                        save_posting(
+                            session,
+                            article,
+                            posting_ref_id,
+                            user_name,
+                            verified,
+                            user_organization,
+                            supporter,
+                            follower_count,
+                            parent_posting_ref_id,
+                            posting_date,
+                            negative_rating_count,
+                            positive_rating_count,
+                            posting_title,
+                            posting_content,
+                            rating_list,
                         )
-                        if posting is None:
-                            posting = Posting(
-                                article.article_id,
-                                user.user_id,
-                                posting_ref_id,
-                                parent_posting_ref_id,
-                                posting_date,
-                                negative_rating_count,
-                                positive_rating_count,
-                                posting_title,
-                                posting_content,
-                            )
-                            db_statement_info = "Added new"
-                        else:
-                            posting.parent_posting_ref_id = parent_posting_ref_id
-                            posting.posting_date = posting_date
-                            posting.negative_rating_count = negative_rating_count
-                            posting.positive_rating_count = positive_rating_count
-                            posting.posting_title = posting_title
-                            posting.posting_content = posting_content
-                            db_statement_info = "Updated"
-                        session.add(posting)
-                        session.commit()
-                        logger.info(f"{db_statement_info} Posting: {posting}")
-
-                        for (user_name, verified, rating_positive) in rating_list:
-                            user = (
-                                session.query(User)
-                                .filter(User.user_name == user_name)
-                                .first()
-                            )
-                            if user is None:
-                                user = User(user_name, verified)
-                                session.add(user)
-                                session.commit()
-                                logger.debug(f"Added new user: {user}")
-                            posting_rating = (
-                                session.query(PostingRating)
-                                .filter(
-                                    PostingRating.posting_id == posting.posting_id,
-                                    PostingRating.user_id == user.user_id,
-                                )
-                                .first()
-                            )
-                            if posting_rating is None:
-                                posting_rating = PostingRating(rating_positive)
-                                posting_rating.posting = posting
-                                posting_rating.user = user
-                                db_statement_info = "Added new"
-                            else:
-                                posting_rating.positive = rating_positive
-                                db_statement_info = "Updated"
-                            session.add(posting_rating)
-                            session.commit()
-                            logger.info(
-                                f"{db_statement_info} PostingRating: {posting_rating}"
-                            )
 
                 if not retries:
-                    logger.warning(f"Max of {args.retries} retries exceeded.")
+                    logger.warning("Max of %s retries exceeded.", args.retries)
                     break
 
+            # add the page's postings and ratings to the summary tables
+            refresh_summaries(session)
+            metrics.increment("crawled_pages")
+            metrics.flush()
+
             # go to next page
             continue_crawling = False
             if (
@@ -474,13 +501,13 @@ if __name__ == "__main__":
             ):
                 driver.find_element_by_class_name("forum-tb-btnnext").click()
                 page_count += 1
-                time.sleep(3)
+                metrics.sleep(3, reason="page")
                 posting_ids = find_posting_ids()
                 logger.info(
-                    f"Crawling {len(posting_ids)} postings on page: {page_count}."
+                    "Crawling %s postings on page: %s.", len(posting_ids), page_count
                 )
                 logger.debug(
-                    f"Found  postings with ids: {posting_ids} on page {page_count}."
+                    "Found  postings with ids: %s on page %s.", posting_ids, page_count
                 )
                 continue_crawling = True
 
@@ -488,5 +515,13 @@ if __name__ == "__main__":
     session.close()
     driver.quit()
     logger.info(
-        f"Completed. Processing took {(datetime.datetime.now() - t1).seconds}s."
+        "Completed. Processing took %ss.", (datetime.datetime.now() - t1).seconds
     )
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(10)
+    with metrics.recording(args.metrics, args.profile):
+        crawl(args)
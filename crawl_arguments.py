@@ -0,0 +1,13 @@
+# kept apart from crawl.py, so cli.py can build its parsers without importing selenium
+
+
+def add_crawl_arguments(parser):
+    parser.add_argument(
+        "--continue-article", help="continue crawling with article", type=int, default=0
+    )
+    parser.add_argument(
+        "--retries", help="max retries per article", type=int, default=10
+    )
+    parser.add_argument(
+        "--no-headless", help="don't run chrome headless", action="store_false"
+    )
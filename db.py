@@ -1,18 +1,59 @@
 from sqlalchemy import (
+    create_engine,
+    inspect,
     Column,
     Boolean,
     Integer,
     String,
     DateTime,
+    Float,
     Text,
     ForeignKey,
+    Index,
+    UniqueConstraint,
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-# from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import relationship, sessionmaker
+
+from metrics import instrument_engine, instrument_session
+
 Base = declarative_base()
-# engine = create_engine("sqlite:///postings.db", encoding="utf-8", echo=True)
-# Session = sessionmaker(bind=engine)
+
+# name the crawler stores for all postings and ratings of deleted users
+DELETED_USER = "<DELETED USER>"
+
+
+def get_watermark(session, name):
+    watermark = session.query(Watermark).get(name)
+    return watermark.value if watermark else 0
+
+
+def set_watermark(session, name, value):
+    watermark = session.query(Watermark).get(name)
+    if watermark is None:
+        watermark = Watermark(name, value)
+    else:
+        watermark.value = value
+    session.add(watermark)
+
+
+def create_missing_indexes(engine):
+    # create_all only creates indexes along with new tables
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(engine)
+
+
+def get_db_session(echo=False, db_url="sqlite:///postings.db"):
+    engine = create_engine(db_url, encoding="utf-8", echo=echo)
+    Base.metadata.create_all(engine)
+    create_missing_indexes(engine)
+    instrument_engine(engine)
+    Session = sessionmaker(bind=engine)
+    return instrument_session(Session())
 
 
 class Article(Base):
@@ -36,7 +77,9 @@ class PostingRating(Base):
     __tablename__ = "posting_ratings"
 
     posting_id = Column(Integer, ForeignKey("postings.posting_id"), primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    user_id = Column(
+        Integer, ForeignKey("users.user_id"), primary_key=True, index=True
+    )
     positive = Column(Boolean, nullable=False)
     # relationships
     posting = relationship("Posting", back_populates="users")
@@ -82,7 +125,9 @@ class Posting(Base):
     __tablename__ = "postings"
 
     posting_id = Column(Integer, primary_key=True)
-    article_id = Column(Integer, ForeignKey(Article.article_id), nullable=False)
+    article_id = Column(
+        Integer, ForeignKey(Article.article_id), nullable=False, index=True
+    )
     user_id = Column(Integer, ForeignKey(User.user_id), nullable=False)
     posting_ref_id = Column(String(256), nullable=False)
     parent_posting_ref_id = Column(String(256), nullable=True, default=None)
@@ -118,3 +163,144 @@ class Posting(Base):
 
     def __repr__(self):
         return f"<Posting {self.posting_ref_id} by {self.user_id}>"
+
+
+class PostingSentiment(Base):
+    __tablename__ = "posting_sentiments"
+
+    posting_id = Column(Integer, ForeignKey(Posting.posting_id), primary_key=True)
+    positive = Column(Boolean, nullable=False)
+    score = Column(Float, nullable=False)
+    model = Column(String(512), nullable=False)
+
+    def __init__(self, posting_id, positive, score, model):
+        self.posting_id = posting_id
+        self.positive = positive
+        self.score = score
+        self.model = model
+
+    def __repr__(self):
+        return f"<PostingSentiment {self.posting_id} {self.positive} ({self.score})>"
+
+
+class Entity(Base):
+    __tablename__ = "entities"
+    __table_args__ = (UniqueConstraint("entity_text", "entity_label"),)
+
+    entity_id = Column(Integer, primary_key=True)
+    entity_text = Column(String(512), nullable=False)
+    entity_label = Column(String(32), nullable=False)
+
+    def __init__(self, entity_text, entity_label):
+        self.entity_text = entity_text
+        self.entity_label = entity_label
+
+    def __repr__(self):
+        return f"<Entity {self.entity_text} ({self.entity_label})>"
+
+
+class PostingEntity(Base):
+    __tablename__ = "posting_entities"
+    __table_args__ = (
+        Index("ix_posting_entities_entity_article", "entity_id", "article_id"),
+    )
+
+    posting_id = Column(Integer, ForeignKey(Posting.posting_id), primary_key=True)
+    entity_id = Column(Integer, ForeignKey(Entity.entity_id), primary_key=True)
+    article_id = Column(Integer, ForeignKey(Article.article_id), nullable=False)
+    mention_count = Column(Integer, nullable=False, default=1)
+
+    def __init__(self, posting_id, entity_id, article_id, mention_count):
+        self.posting_id = posting_id
+        self.entity_id = entity_id
+        self.article_id = article_id
+        self.mention_count = mention_count
+
+    def __repr__(self):
+        return f"<PostingEntity {self.posting_id} {self.entity_id} ({self.mention_count})>"
+
+
+class ArticleEntity(Base):
+    __tablename__ = "article_entities"
+
+    article_id = Column(Integer, ForeignKey(Article.article_id), primary_key=True)
+    entity_id = Column(Integer, ForeignKey(Entity.entity_id), primary_key=True)
+    posting_count = Column(Integer, nullable=False, default=0)
+    mention_count = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, article_id, entity_id, posting_count=0, mention_count=0):
+        self.article_id = article_id
+        self.entity_id = entity_id
+        self.posting_count = posting_count
+        self.mention_count = mention_count
+
+    def __repr__(self):
+        return f"<ArticleEntity {self.article_id} {self.entity_id} ({self.mention_count})>"
+
+
+class Watermark(Base):
+    __tablename__ = "watermarks"
+
+    name = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, name, value=0):
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return f"<Watermark {self.name} {self.value}>"
+
+
+class ArticleSummary(Base):
+    __tablename__ = "article_summaries"
+
+    article_id = Column(Integer, ForeignKey(Article.article_id), primary_key=True)
+    posting_count = Column(Integer, nullable=False, default=0, server_default="0")
+    positive_ratings = Column(Integer, nullable=False, default=0, server_default="0")
+    negative_ratings = Column(Integer, nullable=False, default=0, server_default="0")
+    first_posting_date = Column(DateTime, nullable=True)
+    last_posting_date = Column(DateTime, nullable=True)
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rater_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    def __repr__(self):
+        return f"<ArticleSummary {self.article_id} ({self.posting_count})>"
+
+
+class UserSummary(Base):
+    __tablename__ = "user_summaries"
+
+    user_id = Column(Integer, ForeignKey(User.user_id), primary_key=True)
+    posting_count = Column(Integer, nullable=False, default=0, server_default="0", index=True)
+    positive_ratings = Column(Integer, nullable=False, default=0, server_default="0")
+    negative_ratings = Column(Integer, nullable=False, default=0, server_default="0")
+    first_posting_date = Column(DateTime, nullable=True)
+    last_posting_date = Column(DateTime, nullable=True)
+    ratings_given = Column(Integer, nullable=False, default=0, server_default="0")
+    positive_ratings_given = Column(Integer, nullable=False, default=0, server_default="0")
+    # distinct users who rated the user's postings
+    rater_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    def __repr__(self):
+        return f"<UserSummary {self.user_id} ({self.posting_count})>"
+
+
+class ArticleRater(Base):
+    __tablename__ = "article_raters"
+
+    article_id = Column(Integer, ForeignKey(Article.article_id), primary_key=True)
+    user_id = Column(Integer, ForeignKey(User.user_id), primary_key=True)
+
+    def __repr__(self):
+        return f"<ArticleRater {self.article_id} {self.user_id}>"
+
+
+class UserRater(Base):
+    __tablename__ = "user_raters"
+
+    user_id = Column(Integer, ForeignKey(User.user_id), primary_key=True)
+    rater_id = Column(Integer, ForeignKey(User.user_id), primary_key=True)
+
+    def __repr__(self):
+        return f"<UserRater {self.user_id} {self.rater_id}>"
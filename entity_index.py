@@ -0,0 +1,249 @@
+import logging
+
+# useful stuff
+from collections import Counter, defaultdict
+from string import punctuation
+
+# db
+from sqlalchemy import func, text
+from sqlalchemy.orm import aliased
+
+# project specific
+from db import (
+    get_watermark,
+    set_watermark,
+    ArticleEntity,
+    Entity,
+    Posting,
+    PostingEntity,
+)
+import metrics
+
+logger = logging.getLogger("entity_index")
+
+WATERMARK = "entity_index"
+STRIP_CHARS = punctuation + " „“”»«‚‘’–"
+
+
+def normalize_entity(entity_text):
+    return " ".join(entity_text.lower().split()).strip(STRIP_CHARS)
+
+
+def get_doc_entities(doc):
+    entities = ((normalize_entity(ent.text), ent.label_) for ent in doc.ents)
+    return Counter((text, label) for (text, label) in entities if text)
+
+
+def get_entity_ids(session, keys):
+    """
+    Map (entity_text, entity_label) keys to entity ids, adding unknown entities.
+    """
+    entity_ids = {}
+    texts = list({entity_text for (entity_text, _) in keys})
+    # stay below sqlite's limit of variables per statement
+    for i in range(0, len(texts), 500):
+        for entity in session.query(Entity).filter(
+            Entity.entity_text.in_(texts[i : i + 500])
+        ):
+            entity_ids[(entity.entity_text, entity.entity_label)] = entity.entity_id
+    new_entities = [Entity(*key) for key in keys if key not in entity_ids]
+    if new_entities:
+        session.add_all(new_entities)
+        session.flush()
+        for entity in new_entities:
+            entity_ids[(entity.entity_text, entity.entity_label)] = entity.entity_id
+    return entity_ids
+
+
+def add_posting_entities(session, posting_entities):
+    """
+    Add entities of processed postings to the index.
+    posting_entities is a list of (posting_id, article_id, Counter of (entity_text, entity_label)).
+    Postings must not have been indexed before, otherwise article counts are inflated.
+    """
+    keys = {key for (_, _, entities) in posting_entities for key in entities}
+    if not keys:
+        return
+    entity_ids = get_entity_ids(session, keys)
+
+    article_counts = defaultdict(lambda: [0, 0])
+    rows = []
+    for (posting_id, article_id, entities) in posting_entities:
+        for (key, mention_count) in entities.items():
+            entity_id = entity_ids[key]
+            rows.append(
+                {
+                    "posting_id": posting_id,
+                    "entity_id": entity_id,
+                    "article_id": article_id,
+                    "mention_count": mention_count,
+                }
+            )
+            article_counts[(article_id, entity_id)][0] += 1
+            article_counts[(article_id, entity_id)][1] += mention_count
+    session.execute(PostingEntity.__table__.insert(), rows)
+    session.execute(
+        text(
+            "INSERT INTO article_entities (article_id, entity_id, posting_count, mention_count) "
+            "VALUES (:article_id, :entity_id, :posting_count, :mention_count) "
+            "ON CONFLICT (article_id, entity_id) DO UPDATE SET "
+            "posting_count = posting_count + excluded.posting_count, "
+            "mention_count = mention_count + excluded.mention_count"
+        ),
+        [
+            {
+                "article_id": article_id,
+                "entity_id": entity_id,
+                "posting_count": posting_count,
+                "mention_count": mention_count,
+            }
+            for ((article_id, entity_id), (posting_count, mention_count)) in article_counts.items()
+        ],
+    )
+
+
+def clear_index(session):
+    session.query(ArticleEntity).delete()
+    session.query(PostingEntity).delete()
+    session.query(Entity).delete()
+    set_watermark(session, WATERMARK, 0)
+    session.commit()
+
+
+def update_index(session, nlp, chunk_size=1000, batch_size=64):
+    """
+    Run nlp over all postings added since the last update and add their entities to the index.
+    Progress is committed per chunk, so an interrupted update continues where it stopped.
+    """
+    last_posting_id = get_watermark(session, WATERMARK)
+    indexed = 0
+    while True:
+        chunk = (
+            session.query(
+                Posting.posting_id,
+                Posting.article_id,
+                Posting.posting_title,
+                Posting.posting_content,
+            )
+            .filter(Posting.posting_id > last_posting_id)
+            .order_by(Posting.posting_id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not chunk:
+            break
+        with metrics.timer("nlp", stage="entity_index"):
+            docs = nlp.pipe(
+                ((title or "") + "\n" + content for (_, _, title, content) in chunk),
+                batch_size=batch_size,
+                disable=["tagger", "parser"],
+            )
+            posting_entities = [
+                (posting_id, article_id, get_doc_entities(doc))
+                for ((posting_id, article_id, _, _), doc) in zip(chunk, docs)
+            ]
+        metrics.increment("nlp_docs", len(chunk), stage="entity_index")
+        add_posting_entities(session, posting_entities)
+        last_posting_id = chunk[-1][0]
+        set_watermark(session, WATERMARK, last_posting_id)
+        session.commit()
+        indexed += len(chunk)
+        logger.debug(f"Indexed {indexed} postings, last posting id: {last_posting_id}.")
+    logger.info(f"Indexed {indexed} new postings.")
+    return indexed
+
+
+def find_candidate_posting_ids(session, entity_texts, article_id):
+    """
+    Return ids of postings mentioning one of the entities or not being indexed yet.
+    """
+    posting_ids = {
+        x[0]
+        for x in session.query(Posting.posting_id)
+        .filter(Posting.article_id == article_id)
+        .filter(Posting.posting_id > get_watermark(session, WATERMARK))
+    }
+    for entity_text in entity_texts:
+        posting_ids.update(
+            posting_id
+            for (posting_id, _, _) in find_postings(
+                session, entity_text, article_id=article_id
+            )
+        )
+    return posting_ids
+
+
+def get_entities_query(session, entity_text, entity_label=None):
+    query = session.query(Entity.entity_id).filter(
+        Entity.entity_text == normalize_entity(entity_text)
+    )
+    if entity_label:
+        query = query.filter(Entity.entity_label == entity_label)
+    return query
+
+
+def find_postings(session, entity_text, entity_label=None, article_id=None):
+    """
+    Return (posting_id, article_id, mention_count) of postings mentioning the entity.
+    """
+    query = session.query(
+        PostingEntity.posting_id,
+        PostingEntity.article_id,
+        func.sum(PostingEntity.mention_count),
+    ).filter(
+        PostingEntity.entity_id.in_(
+            get_entities_query(session, entity_text, entity_label).subquery()
+        )
+    )
+    if article_id is not None:
+        query = query.filter(PostingEntity.article_id == article_id)
+    return query.group_by(PostingEntity.posting_id).order_by(PostingEntity.posting_id).all()
+
+
+def top_entities(session, article_id, limit=30, entity_label=None):
+    """
+    Return (entity_text, entity_label, posting_count, mention_count) of the most mentioned entities.
+    """
+    query = (
+        session.query(
+            Entity.entity_text,
+            Entity.entity_label,
+            ArticleEntity.posting_count,
+            ArticleEntity.mention_count,
+        )
+        .filter(ArticleEntity.entity_id == Entity.entity_id)
+        .filter(ArticleEntity.article_id == article_id)
+    )
+    if entity_label:
+        query = query.filter(Entity.entity_label == entity_label)
+    return query.order_by(ArticleEntity.mention_count.desc()).limit(limit).all()
+
+
+def co_occurring_entities(
+    session, entity_text, entity_label=None, article_id=None, limit=30
+):
+    """
+    Return (entity_text, entity_label, posting_count) of entities mentioned in the same postings.
+    """
+    entity_ids = get_entities_query(session, entity_text, entity_label).subquery()
+    mentioned = aliased(PostingEntity)
+    other = aliased(PostingEntity)
+    query = (
+        session.query(
+            Entity.entity_text,
+            Entity.entity_label,
+            func.count(func.distinct(other.posting_id)),
+        )
+        .filter(mentioned.entity_id.in_(entity_ids))
+        .filter(other.posting_id == mentioned.posting_id)
+        .filter(other.entity_id.notin_(entity_ids))
+        .filter(Entity.entity_id == other.entity_id)
+    )
+    if article_id is not None:
+        query = query.filter(mentioned.article_id == article_id)
+    return (
+        query.group_by(other.entity_id)
+        .order_by(func.count(func.distinct(other.posting_id)).desc())
+        .limit(limit)
+        .all()
+    )
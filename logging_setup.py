@@ -0,0 +1,107 @@
+import atexit
+import datetime
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+FORMAT = "%(asctime)-15s %(levelname)s %(message)s"
+
+# logger names printed to the console, all records go to the log file
+console_names = set()
+listener = None
+
+
+class ConsoleFilter(logging.Filter):
+    def filter(self, record):
+        return any(
+            record.name == name or record.name.startswith(name + ".")
+            for name in console_names
+        )
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Pass a record logged with extra=RATE_LIMITED at most once per interval seconds and message
+    template, the next passing record reports how many similar ones were suppressed.
+    Needs lazy %-formatting, as the template is the key.
+    """
+
+    def __init__(self, interval=60.0):
+        super().__init__()
+        self.interval = interval
+        # last time passed and number of suppressed records per template
+        self.seen = {}
+
+    def filter(self, record):
+        if not getattr(record, "rate_limited", False):
+            return True
+        now = time.monotonic()
+        (last, suppressed) = self.seen.get(record.msg, (None, 0))
+        if last is not None and now - last < self.interval:
+            self.seen[record.msg] = (last, suppressed + 1)
+            return False
+        self.seen[record.msg] = (now, 0)
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+RATE_LIMITED = {"rate_limited": True}
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # merge the arguments in the logging thread, they may be database objects of its session,
+        # but leave the more expensive formatting of time and level to the listener
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def use_handlers_directly():
+    # a forked worker process doesn't run the parent's listener thread
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, BackgroundHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
+
+
+def setup_logging(name, filename=None, verbose=False):
+    """
+    Log records of all loggers to log/<date>_<filename or name>.log and records of logger name
+    to the console. Files and console are written by a background thread, the first call
+    of a process decides the log file.
+    """
+    global listener
+    if listener is None:
+        os.makedirs("log", exist_ok=True)
+        file_handler = logging.FileHandler(
+            f"log/{datetime.datetime.now()}_{filename or name}.log"
+        )
+        file_handler.setFormatter(logging.Formatter(FORMAT))
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(FORMAT))
+        console_handler.addFilter(ConsoleFilter())
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        root.addHandler(BackgroundHandler(log_queue))
+        root.setLevel(logging.INFO)
+        listener = logging.handlers.QueueListener(
+            log_queue, file_handler, console_handler
+        )
+        listener.start()
+        # flush remaining records on exit
+        atexit.register(listener.stop)
+        os.register_at_fork(after_in_child=use_handlers_directly)
+    console_names.add(name)
+    logger = logging.getLogger(name)
+    if verbose:
+        logger.setLevel(logging.DEBUG)
+    return logger
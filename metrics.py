@@ -0,0 +1,251 @@
+import cProfile
+import functools
+import json
+import resource
+import sys
+import time
+
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+# upper bounds in seconds, from single db queries up to slow page loads
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+PREFIX = "psa"
+
+# keyed by (name, sorted label items)
+counters = defaultdict(float)
+# bucket counts (last one for values above all buckets), sum, count and max per key
+histograms = {}
+export_path = None
+
+
+def get_key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def increment(name, value=1, **labels):
+    counters[get_key(name, labels)] += value
+
+
+def get_histogram(key):
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0, 0.0]
+    return histogram
+
+
+def observe(name, seconds, **labels):
+    histogram = get_histogram(get_key(name, labels))
+    histogram[0][bisect_left(BUCKETS, seconds)] += 1
+    histogram[1] += seconds
+    histogram[2] += 1
+    histogram[3] = max(histogram[3], seconds)
+
+
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def sleep(seconds, reason="wait"):
+    with timer("sleep", reason=reason):
+        time.sleep(seconds)
+
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_start = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        observe(
+            "db_query",
+            time.perf_counter() - context.metrics_start,
+            statement=statement.lstrip().split(None, 1)[0].lower(),
+        )
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    return engine
+
+
+def instrument_session(session):
+    session.commit = timed("db_commit")(session.commit)
+    return session
+
+
+def instrument_driver(driver):
+    # element lookups and clicks go through the driver's execute as well
+    execute = driver.execute
+
+    def timed_execute(driver_command, params=None):
+        with timer("webdriver_command", command=driver_command):
+            return execute(driver_command, params)
+
+    driver.execute = timed_execute
+    return driver
+
+
+def reset():
+    # forked worker processes start with a copy of their parent's metrics
+    counters.clear()
+    histograms.clear()
+
+
+def pop_snapshot():
+    """
+    Return and reset the metrics recorded so far, to send them from a worker process to its parent.
+    """
+    snapshot = (dict(counters), dict(histograms))
+    reset()
+    return snapshot
+
+
+def merge(snapshot):
+    (snapshot_counters, snapshot_histograms) = snapshot
+    for (key, value) in snapshot_counters.items():
+        counters[key] += value
+    for (key, (buckets, total, count, maximum)) in snapshot_histograms.items():
+        histogram = get_histogram(key)
+        histogram[0] = [a + b for (a, b) in zip(histogram[0], buckets)]
+        histogram[1] += total
+        histogram[2] += count
+        histogram[3] = max(histogram[3], maximum)
+
+
+def get_metrics():
+    return {
+        "counters": [
+            {"name": name, "labels": dict(labels), "value": value}
+            for ((name, labels), value) in sorted(counters.items())
+        ],
+        "timers": [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": count,
+                "sum_seconds": round(total, 6),
+                "max_seconds": round(maximum, 6),
+                "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], buckets)),
+            }
+            for ((name, labels), (buckets, total, count, maximum)) in sorted(
+                histograms.items()
+            )
+        ],
+    }
+
+
+def format_labels(labels, **extra_labels):
+    labels = list(labels) + list(extra_labels.items())
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for (k, v) in labels) + "}"
+
+
+def get_prometheus_text():
+    lines = []
+    # sorted by name, so each metric's type is declared once before all its label sets
+    for ((name, labels), value) in sorted(counters.items()):
+        metric = f"{PREFIX}_{name}_total"
+        if f"# TYPE {metric} counter" not in lines:
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{format_labels(labels)} {value}")
+    for ((name, labels), (buckets, total, count, _)) in sorted(histograms.items()):
+        metric = f"{PREFIX}_{name}_seconds"
+        if f"# TYPE {metric} histogram" not in lines:
+            lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for (bound, bucket_count) in zip(list(BUCKETS) + ["+Inf"], buckets):
+            cumulative += bucket_count
+            lines.append(
+                f"{metric}_bucket{format_labels(labels, le=bound)} {cumulative}"
+            )
+        lines.append(f"{metric}_sum{format_labels(labels)} {total}")
+        lines.append(f"{metric}_count{format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path):
+    """
+    Write all metrics to path, in prometheus' text format for .prom files, otherwise as json.
+    """
+    with open(path, "w") as f:
+        if path.endswith(".prom"):
+            f.write(get_prometheus_text())
+        else:
+            json.dump(get_metrics(), f, indent=2)
+
+
+def configure(path):
+    global export_path
+    export_path = path
+
+
+def flush():
+    # lets long runs export intermediate results, e.g. after every crawled page
+    if export_path:
+        export(export_path)
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument(
+        "--metrics",
+        help="export timers and counters to this file, prometheus' text format for .prom files, otherwise json",
+        default=None,
+    )
+    parser.add_argument(
+        "--profile", help="write cProfile stats of the run to this file", default=None
+    )
+
+
+@contextmanager
+def recording(metrics_path=None, profile_path=None):
+    """
+    Export metrics to metrics_path and cProfile stats to profile_path, if given, when the run ends.
+    """
+    configure(metrics_path)
+    profiler = start_profiler() if profile_path else None
+    try:
+        yield
+    finally:
+        # also keep metrics and profile of aborted runs, e.g. an interrupted crawl
+        if profiler is not None:
+            stop_profiler(profiler, profile_path)
+        flush()
+
+
+def start_profiler():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profiler(profiler, path):
+    profiler.disable()
+    profiler.dump_stats(path)
+
+
+def get_peak_memory_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on linux
+    peak = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024 ** 2
+    return peak / 1024
@@ -0,0 +1,18 @@
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def load_nlp(model="de_core_news_lg", sentiws_path=None):
+    """
+    Load a spaCy pipeline once per process.
+    spaCy and the model are only imported on first use, as loading them takes several seconds
+    and more than a GB of memory, which stages without nlp shouldn't pay for.
+    """
+    import spacy
+
+    nlp = spacy.load(model)
+    if sentiws_path:
+        from spacy_sentiws import spaCySentiWS
+
+        nlp.add_pipe(spaCySentiWS(sentiws_path=sentiws_path))
+    return nlp
@@ -0,0 +1,100 @@
+import os
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+# db
+from sqlalchemy import func
+
+# project specific
+from aggregates import get_interactions
+from db import Article, User, DELETED_USER
+
+
+def get_active_users(session, article_ids=None):
+    """
+    Return distinct (article_id, user_id, posted, rated) rows of users who posted or rated in an article.
+    """
+    interactions = get_interactions(session, article_ids)
+    query = (
+        session.query(
+            interactions.c.article_id,
+            interactions.c.user_id,
+            1 - func.min(interactions.c.is_rating),
+            func.max(interactions.c.is_rating),
+        )
+        .filter(interactions.c.user_id == User.user_id)
+        # all deleted users share one user, which would connect every article
+        .filter(User.user_name != DELETED_USER)
+        .group_by(interactions.c.article_id, interactions.c.user_id)
+    )
+    # skip the orm and read all ids straight into one array, there's a row per active user and article
+    return np.fromiter(
+        chain.from_iterable(session.execute(query.statement)), dtype=np.int64
+    ).reshape(-1, 4)
+
+
+def get_audience_overlap(session, article_ids=None):
+    """
+    Return the article x article matrices of shared active users and their jaccard index
+    and the number of articles every user posted or rated in.
+    """
+    active_users = get_active_users(session, article_ids)
+    (articles, article_index) = np.unique(active_users[:, 0], return_inverse=True)
+    (users, user_index) = np.unique(active_users[:, 1], return_inverse=True)
+    shape = (len(articles), len(users))
+
+    def get_matrix(mask):
+        return csr_matrix(
+            (np.ones(mask.sum(), dtype=np.int64), (article_index[mask], user_index[mask])),
+            shape=shape,
+        )
+
+    active = get_matrix(np.ones(len(active_users), dtype=bool))
+    posted = get_matrix(active_users[:, 2] == 1)
+    rated = get_matrix(active_users[:, 3] == 1)
+
+    # shared users of every pair of articles, the diagonal holds each article's audience size
+    shared = (active @ active.T).toarray()
+    audience = np.diag(shared)
+    union = audience[:, None] + audience[None, :] - shared
+    jaccard = np.divide(
+        shared, union, out=np.zeros(shared.shape, dtype=np.float64), where=union > 0
+    )
+
+    user_names = dict(session.query(User.user_id, User.user_name))
+    user_activity = pd.DataFrame(
+        {
+            "user_id": users,
+            "user_name": [user_names.get(user_id) for user_id in users],
+            "article_count": np.asarray(active.sum(axis=0)).ravel(),
+            "posted_article_count": np.asarray(posted.sum(axis=0)).ravel(),
+            "rated_article_count": np.asarray(rated.sum(axis=0)).ravel(),
+        }
+    ).sort_values("article_count", ascending=False, kind="stable")
+
+    article_index = pd.Index(articles, name="article_id")
+    return (
+        pd.DataFrame(shared, index=article_index, columns=articles),
+        pd.DataFrame(jaccard, index=article_index, columns=articles),
+        user_activity.reset_index(drop=True),
+    )
+
+
+def export_audience_overlap(session, output_dir, article_ids=None):
+    (shared, jaccard, user_activity) = get_audience_overlap(session, article_ids)
+    os.makedirs(output_dir, exist_ok=True)
+    article_urls = dict(session.query(Article.article_id, Article.article_url))
+    pd.DataFrame(
+        {
+            "article_id": shared.index,
+            "article_url": [article_urls[article_id] for article_id in shared.index],
+            "active_users": np.diag(shared.values),
+        }
+    ).to_csv(os.path.join(output_dir, "article_audience.csv"), index=False)
+    shared.to_csv(os.path.join(output_dir, "article_overlap.csv"))
+    jaccard.to_csv(os.path.join(output_dir, "article_jaccard.csv"))
+    user_activity.to_csv(os.path.join(output_dir, "user_activity.csv"), index=False)
+    return shared, jaccard, user_activity
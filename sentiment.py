@@ -1,64 +1,62 @@
 import argparse
-import logging
 import datetime
-import spacy
+import multiprocessing
+import os
+import joblib
+import numpy as np
 import pandas as pd
 
 # useful stuff
-from collections import Counter
+from itertools import chain
 from string import punctuation
 
 # db
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-# spacy and nlp stuff
-from spacy.lang.de.stop_words import STOP_WORDS
-from spacy.tokens import Token
-from spacy_sentiws import spaCySentiWS
+from sqlalchemy import func
 
 # machine learning
 from sklearn.metrics import classification_report, confusion_matrix
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.model_selection import train_test_split
-from sklearn.svm import LinearSVC
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
 from sklearn.pipeline import Pipeline
 
 # project specific
-from db import Base, Article, Posting, PostingRating, User
+from db import get_db_session, Article, Posting, PostingSentiment
+from entity_index import find_candidate_posting_ids, normalize_entity, update_index
+from logging_setup import setup_logging
+import metrics
+from nlp_pipeline import load_nlp
+from sentiment_arguments import (
+    add_entities_arguments,
+    add_predict_arguments,
+    add_train_arguments,
+)
 
 # arguments
 parser = argparse.ArgumentParser()
 parser.add_argument("--verbose", help="increase output verbosity", action="store_true")
+metrics.add_metrics_arguments(parser)
+subparsers = parser.add_subparsers(dest="command")
+entities_parser = subparsers.add_parser(
+    "entities", help="entity sentiments based on SentiWS (default)"
+)
+add_entities_arguments(entities_parser)
+train_parser = subparsers.add_parser(
+    "train", help="train classifier using posting ratings as labels"
+)
+add_train_arguments(train_parser)
+predict_parser = subparsers.add_parser(
+    "predict", help="classify all postings with a trained model"
+)
+add_predict_arguments(predict_parser)
 
 
 # logging
-FORMAT = "%(asctime)-15s %(levelname)s %(message)s"
-logging.basicConfig(filename=f"log/{datetime.datetime.now()}_sentiment.log", format=FORMAT, level=20)
-logger = logging.getLogger("sentiment")
-
-# create console handler and set level to debug
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-
-# create formatter
-formatter = logging.Formatter(FORMAT)
-
-# add formatter to ch
-ch.setFormatter(formatter)
-
-# add ch to logger
-logger.addHandler(ch)
-
-
-def get_db_session(echo=False):
-    engine = create_engine("sqlite:///postings.db", encoding="utf-8", echo=echo)
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session()
+logger = setup_logging("sentiment")
 
 
 def get_cleaned_tokens(sentence):
+    from spacy.lang.de.stop_words import STOP_WORDS
+
     tokens = []
     # get tokens in lower case
     for token in sentence:
@@ -75,7 +73,7 @@ def get_cleaned_tokens(sentence):
     return cleaned_tokens
 
 
-def get_classify_postings(article_id):
+def get_classify_postings(session, nlp, article_id, posting_ids=None):
     data_dict = {
         'posting_id': [],
         'article_id': [],
@@ -87,10 +85,20 @@ def get_classify_postings(article_id):
         'sentiment': [],
         'entity': []
     }
-    for posting in session.query(Posting).filter(Posting.article_id == article_id):
+    query = session.query(Posting).filter(Posting.article_id == article_id)
+    postings = query
+    if posting_ids is not None:
+        posting_ids = sorted(posting_ids)
+        # stay below sqlite's limit of variables per statement
+        postings = chain.from_iterable(
+            query.filter(Posting.posting_id.in_(posting_ids[i : i + 500]))
+            for i in range(0, len(posting_ids), 500)
+        )
+    for posting in postings:
         text = posting.posting_title + "\n" + posting.posting_content
         sentiment = 0.0  # neutral
-        doc = nlp(text)
+        with metrics.timer("nlp", stage="sentiment"):
+            doc = nlp(text)
         for ent in doc.ents:
             head = ent.root.head
             if head._.sentiws:
@@ -124,32 +132,246 @@ def get_classify_postings(article_id):
     return pd.DataFrame(data_dict)
 
 
-if __name__ == '__main__':
-    t1 = datetime.datetime.now()
-    args = parser.parse_args()
-    if args.verbose:
-        logger.setLevel(10)
-    session = get_db_session(args.verbose)
-    nlp = spacy.load("de_core_news_lg")
-    sentiws = spaCySentiWS(sentiws_path='sentiws/')
-    nlp.add_pipe(sentiws)
-    # nlp = spacy.load("de_core_news_md")
-    # nlp = spacy.load("de_core_news_sm")
+def get_posting_text(posting_title, posting_content):
+    return (posting_title or "") + "\n" + posting_content
+
+
+def get_vectorizer():
+    # stateless, so it never has to see the whole corpus
+    return HashingVectorizer(
+        n_features=2 ** 20, ngram_range=(1, 2), alternate_sign=False
+    )
+
+
+def iter_labeled_posting_chunks(session, chunk_size, min_ratings):
+    """
+    Yield chunks of (posting_id, text, label) ordered by posting_id.
+    Postings with a clear rating majority are labeled positive (1) or negative (0),
+    everything in between is skipped.
+    """
+    last_posting_id = 0
+    while True:
+        chunk = (
+            session.query(
+                Posting.posting_id,
+                Posting.posting_title,
+                Posting.posting_content,
+                Posting.positive_rating - Posting.negative_rating,
+            )
+            .filter(Posting.posting_id > last_posting_id)
+            .filter(
+                func.abs(Posting.positive_rating - Posting.negative_rating)
+                >= min_ratings
+            )
+            .order_by(Posting.posting_id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not chunk:
+            break
+        last_posting_id = chunk[-1][0]
+        yield [
+            (posting_id, get_posting_text(title, content), int(rating > 0))
+            for (posting_id, title, content, rating) in chunk
+        ]
+
+
+def is_test_posting(posting_id, test_share):
+    # stable split, a posting stays in the same set over all epochs and runs
+    return posting_id % 100 < test_share * 100
+
 
-    entities = ['fpö']
+def train_classifier(
+    session, model_path, chunk_size=10000, epochs=3, min_ratings=2, test_share=0.2
+):
+    vectorizer = get_vectorizer()
+    classifier = SGDClassifier(loss="hinge", alpha=1e-5, random_state=42)
+    classes = np.array([0, 1])
+    trained = 0
+    for epoch in range(epochs):
+        trained = 0
+        for chunk in iter_labeled_posting_chunks(session, chunk_size, min_ratings):
+            train_chunk = [
+                (text, label)
+                for (posting_id, text, label) in chunk
+                if not is_test_posting(posting_id, test_share)
+            ]
+            if not train_chunk:
+                continue
+            texts, labels = zip(*train_chunk)
+            classifier.partial_fit(
+                vectorizer.transform(texts), np.array(labels), classes=classes
+            )
+            trained += len(train_chunk)
+        logger.info(f"Epoch {epoch + 1}/{epochs}: trained on {trained} postings.")
 
+    if not trained:
+        logger.warning(
+            f"No postings with a rating difference of at least {min_ratings} found."
+        )
+        return None
+
+    model = Pipeline([("vectorizer", vectorizer), ("classifier", classifier)])
+
+    # accumulate the confusion matrix chunk by chunk instead of keeping all predictions
+    matrix = np.zeros((2, 2), dtype=int)
+    for chunk in iter_labeled_posting_chunks(session, chunk_size, min_ratings):
+        test_chunk = [
+            (text, label)
+            for (posting_id, text, label) in chunk
+            if is_test_posting(posting_id, test_share)
+        ]
+        if not test_chunk:
+            continue
+        texts, labels = zip(*test_chunk)
+        matrix += confusion_matrix(labels, model.predict(texts), labels=classes)
+    logger.info(f"Confusion matrix:\n{matrix}")
+    if matrix.sum():
+        logger.info(
+            classification_report(
+                [0, 0, 1, 1],
+                [0, 1, 0, 1],
+                sample_weight=matrix.ravel(),
+                labels=classes,
+                target_names=["negative", "positive"],
+                zero_division=0,
+            )
+        )
+
+    model_dir = os.path.dirname(model_path)
+    if model_dir:
+        os.makedirs(model_dir, exist_ok=True)
+    joblib.dump(model, model_path)
+    logger.info(f"Saved model to {model_path}.")
+    return model
+
+
+def init_predict_worker(model, db_url):
+    global worker_model, worker_session
+    metrics.reset()
+    worker_model = model
+    worker_session = get_db_session(db_url=db_url)
+
+
+def predict_posting_range(posting_id_range):
+    (first_posting_id, last_posting_id) = posting_id_range
+    postings = (
+        worker_session.query(
+            Posting.posting_id, Posting.posting_title, Posting.posting_content
+        )
+        .filter(Posting.posting_id.between(first_posting_id, last_posting_id))
+        .all()
+    )
+    if not postings:
+        return ([], metrics.pop_snapshot())
+    with metrics.timer("classify", stage="predict"):
+        scores = worker_model.decision_function(
+            [get_posting_text(title, content) for (_, title, content) in postings]
+        )
+    predictions = [
+        (posting_id, bool(score > 0), float(score))
+        for ((posting_id, _, _), score) in zip(postings, scores)
+    ]
+    return (predictions, metrics.pop_snapshot())
+
+
+def predict_postings(session, model_path, chunk_size=10000, processes=None):
+    # the pool restarts workers whose initializer fails forever, so load the model here
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"{model_path} doesn't exist, train a model first.")
+    model = joblib.load(model_path)
+    (min_posting_id, max_posting_id) = session.query(
+        func.min(Posting.posting_id), func.max(Posting.posting_id)
+    ).first()
+    if min_posting_id is None:
+        logger.warning("No postings to classify.")
+        return 0
+    posting_id_ranges = [
+        (first_posting_id, min(first_posting_id + chunk_size - 1, max_posting_id))
+        for first_posting_id in range(min_posting_id, max_posting_id + 1, chunk_size)
+    ]
+    model_name = os.path.basename(model_path)
+    upsert = PostingSentiment.__table__.insert().prefix_with("OR REPLACE")
+    classified = 0
+    # workers read and classify, only this process writes to the database
+    with multiprocessing.Pool(
+        processes,
+        initializer=init_predict_worker,
+        initargs=(model, str(session.bind.url)),
+    ) as pool:
+        for (predictions, worker_metrics) in pool.imap_unordered(
+            predict_posting_range, posting_id_ranges
+        ):
+            metrics.merge(worker_metrics)
+            if not predictions:
+                continue
+            session.execute(
+                upsert,
+                [
+                    {
+                        "posting_id": posting_id,
+                        "positive": positive,
+                        "score": score,
+                        "model": model_name,
+                    }
+                    for (posting_id, positive, score) in predictions
+                ],
+            )
+            session.commit()
+            classified += len(predictions)
+            logger.debug(f"Classified {classified} postings.")
+    logger.info(f"Classified {classified} postings with model {model_name}.")
+    return classified
+
+
+def get_entity_sentiments(session, nlp, entities=("fpö",)):
+    entities = [normalize_entity(entity) for entity in entities]
+    # index new postings with the loaded model first, so candidates below are only actual mentions
+    update_index(session, nlp)
     for article in session.query(Article):
         logger.info(f"Getting sentiments article: {article.article_url}")
-        classified_postings = get_classify_postings(article.article_id)
+        # only run nlp on postings mentioning the entities according to the index
+        posting_ids = find_candidate_posting_ids(session, entities, article.article_id)
+        logger.debug(f"{len(posting_ids)} postings might mention {entities}.")
+        classified_postings = get_classify_postings(
+            session, nlp, article.article_id, posting_ids
+        )
         logger.debug(classified_postings.describe())
         # for entity in entities:
         entity_df = classified_postings.loc[
-            classified_postings['entity'].isin(entities) &
-            classified_postings['sentiment'] != 0.0
+            classified_postings['entity'].map(normalize_entity).isin(entities) &
+            (classified_postings['sentiment'] != 0.0)
         ]
         logger.info(entity_df.describe)
 
-    session.close()
+
+if __name__ == '__main__':
+    t1 = datetime.datetime.now()
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(10)
+    with metrics.recording(args.metrics, args.profile):
+        session = get_db_session(args.verbose)
+        if args.command == "train":
+            train_classifier(
+                session,
+                args.model,
+                args.chunk_size,
+                args.epochs,
+                args.min_ratings,
+                args.test_share,
+            )
+        elif args.command == "predict":
+            predict_postings(session, args.model, args.chunk_size, args.processes)
+        else:
+            nlp = load_nlp(sentiws_path="sentiws/")
+            # nlp = load_nlp("de_core_news_md", sentiws_path="sentiws/")
+            # nlp = load_nlp("de_core_news_sm", sentiws_path="sentiws/")
+            get_entity_sentiments(
+                session, nlp, getattr(args, "entities", None) or ["fpö"]
+            )
+
+        session.close()
     logger.info(
         f"Completed. Processing took {(datetime.datetime.now() - t1).seconds}s."
     )
\ No newline at end of file
@@ -0,0 +1,45 @@
+import os
+
+# kept apart from sentiment.py, so cli.py can build its parsers without importing scikit-learn
+
+
+def add_entities_arguments(parser):
+    parser.add_argument(
+        "--entity", help="entity to get sentiments for", action="append", dest="entities"
+    )
+
+
+def add_train_arguments(parser):
+    parser.add_argument(
+        "--model", help="path to store the model", default="models/sentiment.joblib"
+    )
+    parser.add_argument(
+        "--chunk-size", help="postings per training chunk", type=int, default=10000
+    )
+    parser.add_argument(
+        "--epochs", help="passes over all postings", type=int, default=3
+    )
+    parser.add_argument(
+        "--min-ratings",
+        help="min difference of positive and negative ratings to label a posting",
+        type=int,
+        default=2,
+    )
+    parser.add_argument(
+        "--test-share",
+        help="share of postings held out for evaluation",
+        type=float,
+        default=0.2,
+    )
+
+
+def add_predict_arguments(parser):
+    parser.add_argument(
+        "--model", help="path of the trained model", default="models/sentiment.joblib"
+    )
+    parser.add_argument(
+        "--chunk-size", help="postings per prediction chunk", type=int, default=10000
+    )
+    parser.add_argument(
+        "--processes", help="number of worker processes", type=int, default=os.cpu_count()
+    )
@@ -1,128 +1,182 @@
 import argparse
-import logging
 import datetime
-import spacy
-import pandas as pd
+import multiprocessing
 
 # useful stuff
 from collections import Counter
-from string import punctuation
-import numpy as np
-import pandas as pd
-
-# db
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
+from itertools import islice
+from contextlib import contextmanager
 
 # project specific
-from db import Base, Article, Posting, PostingRating, User
+from aggregates import get_article_stats, get_user_stats
+from db import get_db_session, Article, Posting
+from entity_index import normalize_entity
+from logging_setup import setup_logging
+import metrics
+from nlp_pipeline import load_nlp
+from statistics_arguments import add_stats_subparsers
+from summaries import get_article_summaries, get_user_summaries, refresh_summaries
+from timeseries import get_posting_rate, get_posting_time_summary
 
 # arguments
 parser = argparse.ArgumentParser()
 parser.add_argument("--verbose", help="increase output verbosity", action="store_true")
+metrics.add_metrics_arguments(parser)
+# without a subcommand the summaries are refreshed and printed
+add_stats_subparsers(parser)
 
 
 # logging
-FORMAT = "%(asctime)-15s %(levelname)s %(message)s"
-logging.basicConfig(
-    filename=f"log/{datetime.datetime.now()}_statistics.log", format=FORMAT, level=20
-)
-logger = logging.getLogger("sentiment")
-
-# create console handler and set level to debug
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-
-# create formatter
-formatter = logging.Formatter(FORMAT)
-
-# add formatter to ch
-ch.setFormatter(formatter)
-
-# add ch to logger
-logger.addHandler(ch)
-
-
-def get_db_session(echo=False):
-    engine = create_engine("sqlite:///postings.db", encoding="utf-8", echo=echo)
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session()
-
-
-def get_time_stats(article_id):
-    posting_times = [
-        t[0]
-        for t in session.query(Posting.posting_date)
-        .filter(Posting.article_id == article_id)
-        .order_by(Posting.posting_date)
-    ]
-    time_series = pd.Series(posting_times, dtype="datetime64[ns]")
-    df = pd.DataFrame(time_series)
-    logger.info(time_series.mean())
-    # logger.info(time_series.median())
-    logger.info(time_series.describe())
-
-
-def get_posting_stats(article_id, limit=20):
-    user_postings = (
-        session.query(
-            User.user_name,
-            func.count(Posting.user_id),
-            func.sum(Posting.positive_rating),
-            func.sum(Posting.negative_rating),
-        )
-        .filter(Posting.user_id == User.user_id)
-        .filter(User.user_name != "")
-        .filter(Posting.article_id == article_id)
-        .group_by(Posting.user_id)
-        .order_by(func.count(Posting.user_id).desc())
+logger = setup_logging("statistics")
+
+
+def get_time_stats(
+    session, article_ids=None, resolution="hour", since_publication=False
+):
+    logger.info(
+        f"Posting times:\n{get_posting_time_summary(session, article_ids).to_string(index=False)}"
     )
-    user_stats = [(x[0], x[1], x[2], x[3]) for x in user_postings]
-    df = pd.DataFrame(
-        user_stats,
-        columns=["user_name", "posting_count", "positive_ratings", "negative_ratings"],
+    posting_rate = get_posting_rate(session, article_ids, resolution, since_publication)
+    for (article_id, article_rate) in posting_rate.groupby("article_id"):
+        logger.info(f"Postings per {resolution} for article {article_id}:")
+        logger.info(article_rate.drop(columns="article_id").to_string(index=False))
+    return posting_rate
+
+
+def get_posting_stats(session, article_ids=None):
+    article_stats = get_article_stats(session, article_ids)
+    user_stats = get_user_stats(session, article_ids)
+    for article in article_stats.itertuples():
+        logger.info(f"Posting stats for article: {article.article_url}")
+        logger.info(
+            user_stats.loc[
+                user_stats["article_id"] == article.article_id,
+                ["posting_count", "positive_ratings", "negative_ratings"],
+            ].describe()
+        )
+        logger.info(
+            f"Interactions: {article.interacting_user_count} {article.positive_ratings} {article.negative_ratings}"
+        )
+    return article_stats, user_stats
+
+
+def get_summary_stats(session, refresh=True, full=False, limit=20):
+    if refresh:
+        (postings, ratings) = refresh_summaries(session, full)
+        logger.info(f"Added {postings} postings and {ratings} ratings to the summaries.")
+    logger.info(
+        f"Article summaries:\n{get_article_summaries(session).to_string(index=False)}"
     )
-    logger.info(df.describe())
-    user_ids = [
-        x[0]
-        for x in session.query(Posting.user_id).filter(Posting.article_id == article_id)
-    ]
-    user_ids += [
-        x[0]
-        for x in session.query(PostingRating.user_id, Posting.posting_id)
-        .filter(PostingRating.posting_id == Posting.posting_id)
-        .filter(Posting.article_id == article_id)
-    ]
-    user_ids = set(user_ids)
-    positive_ratings = (
-        session.query(func.sum(Posting.positive_rating))
-        .filter(Posting.article_id == article_id)
-        .first()[0]
+    logger.info(
+        f"Most active users:\n{get_user_summaries(session, limit).to_string(index=False)}"
     )
 
-    negative_ratings = (
-        session.query(func.sum(Posting.negative_rating))
-            .filter(Posting.article_id == article_id)
-            .first()
-    )[0]
 
-    logger.info(f"Interactions: {len(user_ids)} {positive_ratings} {negative_ratings}")
+def get_overlap_stats(session, output_dir="stats", article_ids=None, limit=20):
+    # scipy is only imported by stages which need it
+    from overlap import export_audience_overlap
 
+    (shared, jaccard, user_activity) = export_audience_overlap(
+        session, output_dir, article_ids
+    )
+    logger.info(f"Users posting or rating in both articles:\n{shared}")
+    logger.info(f"Jaccard index of article audiences:\n{jaccard.round(3)}")
+    logger.info(
+        f"Users active in most articles:\n{user_activity.head(limit).to_string(index=False)}"
+    )
+    logger.info(f"Exported audience overlap to {output_dir}.")
 
-def get_posting_entities(article_id, limit=30):
-    text = [text[0] + "\n" + text[1] for text in
-            session.query(Posting.posting_title,
-                          Posting.posting_content).filter(
-                Posting.article_id == article_id)]
 
-    text = "".join(text)
-    doc = nlp(text)
-    entities = [ent.text.lower() for ent in [ents for ents in doc.ents]]
-    entitiy_frequency = Counter(entities)
+def iter_posting_texts(
+    session, article_id, first_posting_id=None, last_posting_id=None
+):
+    query = session.query(Posting.posting_title, Posting.posting_content).filter(
+        Posting.article_id == article_id
+    )
+    if first_posting_id is not None:
+        query = query.filter(
+            Posting.posting_id.between(first_posting_id, last_posting_id)
+        )
+    # one text per posting, so entities don't run across posting boundaries
+    for (posting_title, posting_content) in query.yield_per(1000):
+        yield (posting_title or "") + "\n" + posting_content
+
+
+def count_entities(nlp, texts, batch_size=64, chunk_size=1000):
+    entity_counter = Counter()
+    texts = iter(texts)
+    # texts are read in chunks outside the timer, so database reads don't count as nlp time
+    for chunk in iter(lambda: list(islice(texts, chunk_size)), []):
+        with metrics.timer("nlp", stage="entities"):
+            for doc in nlp.pipe(chunk, batch_size=batch_size, disable=["tagger", "parser"]):
+                entity_counter.update(
+                    filter(None, (normalize_entity(ent.text) for ent in doc.ents))
+                )
+        metrics.increment("nlp_docs", len(chunk), stage="entities")
+    return entity_counter
+
+
+def init_entity_worker(db_url):
+    global worker_session, worker_nlp
+    metrics.reset()
+    worker_session = get_db_session(db_url=db_url)
+    # already loaded, if the worker was forked from entity_pool's process
+    worker_nlp = load_nlp()
+
+
+def count_posting_range_entities(posting_range):
+    (article_id, first_posting_id, last_posting_id) = posting_range
+    entity_counter = count_entities(
+        worker_nlp,
+        iter_posting_texts(worker_session, article_id, first_posting_id, last_posting_id),
+    )
+    return (entity_counter, metrics.pop_snapshot())
+
+
+@contextmanager
+def entity_pool(session, processes):
+    """
+    Worker processes loading the pipeline once for all articles, None for a single process.
+    """
+    if processes <= 1:
+        yield None
+        return
+    # the pool restarts workers whose initializer fails forever, so a missing spaCy or model
+    # has to fail here, forked workers inherit the loaded pipeline
+    load_nlp()
+    with multiprocessing.Pool(
+        processes, initializer=init_entity_worker, initargs=(str(session.bind.url),)
+    ) as pool:
+        yield pool
+
+
+def get_posting_entities(session, nlp, article_id, limit=30, pool=None, chunk_size=1000):
+    """
+    Count entities of an article's postings, in pool's workers if given, otherwise with nlp.
+    """
+    if pool is not None:
+        posting_ids = [
+            x[0]
+            for x in session.query(Posting.posting_id)
+            .filter(Posting.article_id == article_id)
+            .order_by(Posting.posting_id)
+        ]
+        posting_ranges = [
+            (article_id, posting_ids[i], posting_ids[i : i + chunk_size][-1])
+            for i in range(0, len(posting_ids), chunk_size)
+        ]
+        entitiy_frequency = Counter()
+        for (counter, worker_metrics) in pool.imap_unordered(
+            count_posting_range_entities, posting_ranges
+        ):
+            entitiy_frequency.update(counter)
+            metrics.merge(worker_metrics)
+    else:
+        entitiy_frequency = count_entities(nlp, iter_posting_texts(session, article_id))
     logger.info(f"Entity Frequency")
     for (entity, frequency) in entitiy_frequency.most_common(limit):
         logger.info(f"{entity} {frequency}")
+    return entitiy_frequency
 
 
 if __name__ == "__main__":
@@ -130,16 +184,41 @@ if __name__ == "__main__":
     args = parser.parse_args()
     if args.verbose:
         logger.setLevel(10)
-    session = get_db_session(args.verbose)
-    nlp = spacy.load("de_core_news_lg")
-
-    for article in session.query(Article):
-        logger.info(f"Getting stats for article: {article.article_url}")
-        get_time_stats(article.article_id)
-        get_posting_stats(article.article_id)
-        get_posting_entities(article.article_id)
-
-    session.close()
+    with metrics.recording(args.metrics, args.profile):
+        session = get_db_session(args.verbose)
+
+        # per article and per user totals come from the summary tables, only new rows are read
+        if args.stats_command is None:
+            get_summary_stats(session)
+        elif args.stats_command == "refresh":
+            (postings, ratings) = refresh_summaries(session, args.full)
+            logger.info(
+                f"Added {postings} postings and {ratings} ratings to the summaries."
+            )
+        elif args.stats_command == "summary":
+            get_summary_stats(session, refresh=False, limit=args.limit)
+        # the other stats read all postings and ratings of the selected articles
+        elif args.stats_command == "time":
+            get_time_stats(
+                session, args.article, args.resolution, args.since_publication
+            )
+        elif args.stats_command == "users":
+            get_posting_stats(session, args.article)
+        elif args.stats_command == "overlap":
+            get_overlap_stats(session, args.output, args.article)
+        else:
+            articles = session.query(Article)
+            if args.article is not None:
+                articles = articles.filter(Article.article_id.in_(args.article))
+            with entity_pool(session, args.processes) as pool:
+                nlp = load_nlp()
+                for article in articles:
+                    logger.info(f"Getting stats for article: {article.article_url}")
+                    get_posting_entities(
+                        session, nlp, article.article_id, args.limit, pool
+                    )
+
+        session.close()
     logger.info(
         f"Completed. Processing took {(datetime.datetime.now() - t1).seconds}s."
     )
@@ -0,0 +1,59 @@
+import os
+
+# kept apart from statistics.py, so cli.py can build its parsers without importing pandas
+
+
+def add_stats_subparsers(parser):
+    """
+    Add the statistics subcommands to parser, the chosen one is stored in stats_command.
+    """
+    stats_subparsers = parser.add_subparsers(dest="stats_command")
+    for (stats_command, stats_help) in [
+        ("time", "posting time statistics"),
+        ("users", "user and rating statistics"),
+        ("entities", "most common entities (loads spaCy)"),
+        ("overlap", "users active in several articles"),
+    ]:
+        stats_command_parser = stats_subparsers.add_parser(
+            stats_command, help=stats_help
+        )
+        stats_command_parser.add_argument(
+            "--article", help="only articles with these ids", type=int, action="append"
+        )
+    refresh_parser = stats_subparsers.add_parser(
+        "refresh", help="add new postings and ratings to the summary tables"
+    )
+    refresh_parser.add_argument(
+        "--full", help="rebuild the summary tables from scratch", action="store_true"
+    )
+    summary_parser = stats_subparsers.add_parser(
+        "summary", help="article and user summaries"
+    )
+    summary_parser.add_argument(
+        "--limit", help="number of users", type=int, default=20
+    )
+    stats_subparsers.choices["time"].add_argument(
+        "--resolution",
+        help="size of the time buckets",
+        choices=["minute", "hour", "day"],
+        default="hour",
+    )
+    stats_subparsers.choices["time"].add_argument(
+        "--since-publication",
+        help="bucket by time since the article's publication",
+        action="store_true",
+    )
+    stats_subparsers.choices["overlap"].add_argument(
+        "--output", help="folder for the exported csv files", default="stats"
+    )
+    stats_subparsers.choices["entities"].add_argument(
+        "--limit", help="number of entities per article", type=int, default=30
+    )
+    stats_subparsers.choices["entities"].add_argument(
+        "--processes",
+        help="number of processes for entity recognition",
+        type=int,
+        # every worker holds its own pipeline of about 1 GB
+        default=min(4, os.cpu_count()),
+    )
+    return stats_subparsers
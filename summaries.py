@@ -0,0 +1,197 @@
+import logging
+
+import pandas as pd
+
+# db
+from sqlalchemy import func, text
+
+# project specific
+from db import (
+    get_watermark,
+    set_watermark,
+    Article,
+    ArticleRater,
+    ArticleSummary,
+    Posting,
+    User,
+    UserRater,
+    UserSummary,
+)
+
+logger = logging.getLogger("summaries")
+
+POSTING_WATERMARK = "summary_postings"
+# posting_ratings has a composite primary key, so new ratings are tracked by sqlite's rowid
+RATING_WATERMARK = "summary_ratings"
+
+ADD_POSTINGS = """
+INSERT INTO {table} ({key}, posting_count, positive_ratings, negative_ratings,
+    first_posting_date, last_posting_date)
+SELECT {key}, count(*), sum(positive_rating), sum(negative_rating),
+    min(posting_date), max(posting_date)
+FROM postings
+WHERE posting_id > :first_id AND posting_id <= :last_id
+GROUP BY {key}
+ON CONFLICT ({key}) DO UPDATE SET
+    posting_count = posting_count + excluded.posting_count,
+    positive_ratings = positive_ratings + excluded.positive_ratings,
+    negative_ratings = negative_ratings + excluded.negative_ratings,
+    first_posting_date = min(coalesce(first_posting_date, excluded.first_posting_date),
+        excluded.first_posting_date),
+    last_posting_date = max(coalesce(last_posting_date, excluded.last_posting_date),
+        excluded.last_posting_date)
+"""
+
+ADD_ARTICLE_RATINGS = """
+INSERT INTO article_summaries (article_id, rating_count)
+SELECT p.article_id, count(*)
+FROM posting_ratings r JOIN postings p ON p.posting_id = r.posting_id
+WHERE r.rowid > :first_id AND r.rowid <= :last_id
+GROUP BY p.article_id
+ON CONFLICT (article_id) DO UPDATE SET
+    rating_count = rating_count + excluded.rating_count
+"""
+
+ADD_USER_RATINGS = """
+INSERT INTO user_summaries (user_id, ratings_given, positive_ratings_given)
+SELECT user_id, count(*), sum(positive)
+FROM posting_ratings
+WHERE rowid > :first_id AND rowid <= :last_id
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET
+    ratings_given = ratings_given + excluded.ratings_given,
+    positive_ratings_given = positive_ratings_given + excluded.positive_ratings_given
+"""
+
+ADD_ARTICLE_RATERS = """
+INSERT OR IGNORE INTO article_raters (article_id, user_id)
+SELECT DISTINCT p.article_id, r.user_id
+FROM posting_ratings r JOIN postings p ON p.posting_id = r.posting_id
+WHERE r.rowid > :first_id AND r.rowid <= :last_id
+"""
+
+ADD_USER_RATERS = """
+INSERT OR IGNORE INTO user_raters (user_id, rater_id)
+SELECT DISTINCT p.user_id, r.user_id
+FROM posting_ratings r JOIN postings p ON p.posting_id = r.posting_id
+WHERE r.rowid > :first_id AND r.rowid <= :last_id
+"""
+
+UPDATE_USER_RATER_COUNTS = """
+UPDATE user_summaries SET rater_count = (
+    SELECT count(*) FROM user_raters WHERE user_raters.user_id = user_summaries.user_id
+)
+WHERE user_id IN (
+    SELECT DISTINCT p.user_id
+    FROM posting_ratings r JOIN postings p ON p.posting_id = r.posting_id
+    WHERE r.rowid > :first_id AND r.rowid <= :last_id
+)
+"""
+
+UPDATE_RATER_COUNTS = """
+UPDATE article_summaries SET rater_count = (
+    SELECT count(*) FROM article_raters WHERE article_raters.article_id = article_summaries.article_id
+)
+WHERE article_id IN (
+    SELECT DISTINCT p.article_id
+    FROM posting_ratings r JOIN postings p ON p.posting_id = r.posting_id
+    WHERE r.rowid > :first_id AND r.rowid <= :last_id
+)
+"""
+
+
+def refresh_summaries(session, full=False):
+    """
+    Add postings and ratings stored since the last refresh to the summary tables and return
+    how many of both were added.
+    Changes to already summarized postings or ratings are only picked up by a full refresh.
+    """
+    if full:
+        session.query(ArticleSummary).delete()
+        session.query(UserSummary).delete()
+        session.query(ArticleRater).delete()
+        session.query(UserRater).delete()
+        set_watermark(session, POSTING_WATERMARK, 0)
+        set_watermark(session, RATING_WATERMARK, 0)
+
+    added_postings = 0
+    first_posting_id = get_watermark(session, POSTING_WATERMARK)
+    last_posting_id = session.query(func.max(Posting.posting_id)).scalar() or 0
+    if last_posting_id > first_posting_id:
+        posting_range = {"first_id": first_posting_id, "last_id": last_posting_id}
+        added_postings = session.execute(
+            text(
+                "SELECT count(*) FROM postings "
+                "WHERE posting_id > :first_id AND posting_id <= :last_id"
+            ),
+            posting_range,
+        ).scalar()
+        session.execute(
+            text(ADD_POSTINGS.format(table="article_summaries", key="article_id")),
+            posting_range,
+        )
+        session.execute(
+            text(ADD_POSTINGS.format(table="user_summaries", key="user_id")),
+            posting_range,
+        )
+        set_watermark(session, POSTING_WATERMARK, last_posting_id)
+
+    added_ratings = 0
+    first_rating_id = get_watermark(session, RATING_WATERMARK)
+    last_rating_id = (
+        session.execute(text("SELECT max(rowid) FROM posting_ratings")).scalar() or 0
+    )
+    if last_rating_id > first_rating_id:
+        rating_range = {"first_id": first_rating_id, "last_id": last_rating_id}
+        added_ratings = session.execute(
+            text(
+                "SELECT count(*) FROM posting_ratings "
+                "WHERE rowid > :first_id AND rowid <= :last_id"
+            ),
+            rating_range,
+        ).scalar()
+        for statement in [
+            ADD_ARTICLE_RATINGS,
+            ADD_USER_RATINGS,
+            ADD_ARTICLE_RATERS,
+            UPDATE_RATER_COUNTS,
+            ADD_USER_RATERS,
+            UPDATE_USER_RATER_COUNTS,
+        ]:
+            session.execute(text(statement), rating_range)
+        set_watermark(session, RATING_WATERMARK, last_rating_id)
+
+    # summaries and watermarks are committed together
+    session.commit()
+    logger.debug(
+        f"Refreshed summaries up to posting {last_posting_id} and rating {last_rating_id}."
+    )
+    return (added_postings, added_ratings)
+
+
+def get_article_summaries(session):
+    columns = [c.name for c in ArticleSummary.__table__.columns]
+    return pd.DataFrame(
+        session.query(
+            Article.article_url,
+            *[getattr(ArticleSummary, column) for column in columns],
+        )
+        .filter(Article.article_id == ArticleSummary.article_id)
+        .order_by(ArticleSummary.article_id)
+        .all(),
+        columns=["article_url"] + columns,
+    )
+
+
+def get_user_summaries(session, limit=20):
+    columns = [c.name for c in UserSummary.__table__.columns]
+    return pd.DataFrame(
+        session.query(
+            User.user_name, *[getattr(UserSummary, column) for column in columns]
+        )
+        .filter(User.user_id == UserSummary.user_id)
+        .order_by(UserSummary.posting_count.desc())
+        .limit(limit)
+        .all(),
+        columns=["user_name"] + columns,
+    )
@@ -0,0 +1,184 @@
+import argparse
+import datetime
+import os
+import random
+
+# project specific
+from db import get_db_session, Article, Posting, PostingRating, User, DELETED_USER
+
+# arguments
+parser = argparse.ArgumentParser(
+    description="fill a database with synthetic articles, users, postings and ratings"
+)
+parser.add_argument("--db", help="path of the database", default="synthetic.db")
+parser.add_argument("--articles", help="number of articles", type=int, default=50)
+parser.add_argument("--users", help="number of users", type=int, default=20000)
+parser.add_argument("--postings", help="number of postings", type=int, default=200000)
+parser.add_argument(
+    "--ratings", help="average ratings per posting", type=float, default=3.0
+)
+parser.add_argument(
+    "--reply-depth", help="max depth of reply threads", type=int, default=5
+)
+parser.add_argument(
+    "--reply-share", help="share of postings replying to another one", type=float, default=0.4
+)
+parser.add_argument("--seed", help="random seed", type=int, default=42)
+parser.add_argument(
+    "--force", help="overwrite an existing database", action="store_true"
+)
+
+WORDS = (
+    "der die das und ist nicht ein eine zu den von mit sich auch auf für es dem "
+    "im als aber wie noch nur wenn schon so bei nach man oder was wird sind hat "
+    "haben kann muss soll wieder immer jetzt heute gestern genau wirklich leider "
+    "natürlich Regierung Partei Politik Wahl Wähler Bericht Historiker Vergangenheit "
+    "Geschichte Verantwortung Demokratie Land Leute Problem Frage Antwort Meinung "
+    "Menschen Zeit Jahr Jahre Kommission Papier Studie Aufarbeitung Kritik Medien "
+    "gut schlecht richtig falsch wichtig peinlich lächerlich ehrlich typisch klar "
+    "sagen glauben denken lesen schreiben verstehen erklären zeigen wissen sehen"
+).split()
+ENTITIES = (
+    "FPÖ ÖVP SPÖ NEOS Grüne Strache Kickl Hofer Kurz Kogler Wien Österreich "
+    "Niederösterreich Parlament EU Deutschland Ibiza derStandard"
+).split()
+
+
+def get_text(rand, min_sentences=1, max_sentences=5):
+    sentences = []
+    for _ in range(rand.randint(min_sentences, max_sentences)):
+        words = [
+            rand.choice(ENTITIES) if rand.random() < 0.08 else rand.choice(WORDS)
+            for _ in range(rand.randint(4, 16))
+        ]
+        sentences.append(
+            words[0][0].upper() + words[0][1:] + " " + " ".join(words[1:]) + rand.choice(".!?")
+        )
+    return " ".join(sentences)
+
+
+def create_synthetic_db(
+    db_path,
+    articles=50,
+    users=20000,
+    postings=200000,
+    ratings=3.0,
+    reply_depth=5,
+    reply_share=0.4,
+    seed=42,
+    force=False,
+):
+    """
+    Create a database with the schema of db.py, the same arguments always produce the same data.
+    """
+    if os.path.exists(db_path):
+        if not force:
+            raise FileExistsError(f"{db_path} exists, use force to overwrite it.")
+        os.remove(db_path)
+    session = get_db_session(db_url=f"sqlite:///{db_path}")
+    rand = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1)
+    publication_dates = {
+        article_id: start
+        + datetime.timedelta(days=article_id, minutes=rand.randint(0, 1440))
+        for article_id in range(1, articles + 1)
+    }
+    session.execute(
+        Article.__table__.insert(),
+        [
+            {
+                "article_id": article_id,
+                "article_title": get_text(rand, 1, 1),
+                "article_url": f"https://www.derstandard.at/story/{2000000000000 + article_id}",
+                "article_publication_date": publication_date,
+            }
+            for (article_id, publication_date) in publication_dates.items()
+        ],
+    )
+    # user 1 stands for all deleted users, as the crawler stores them
+    session.execute(
+        User.__table__.insert(),
+        [
+            {
+                "user_id": user_id,
+                "user_name": DELETED_USER if user_id == 1 else f"Poster{user_id}",
+                "user_organization": None,
+                "verified": rand.random() < 0.05,
+                "follower_count": int(rand.paretovariate(1.5)) - 1,
+                "supporter": rand.random() < 0.02,
+            }
+            for user_id in range(1, users + 1)
+        ],
+    )
+
+    posting_rows = []
+    rating_rows = []
+    # depth and ref id of recent postings per article, replies pick their parent from these
+    threads = {article_id: [] for article_id in publication_dates}
+    for posting_id in range(1, postings + 1):
+        article_id = rand.randint(1, articles)
+        posting_ref_id = str(1000000000 + posting_id)
+        parent_posting_ref_id = None
+        depth = 0
+        if threads[article_id] and rand.random() < reply_share:
+            (parent_depth, parent_ref_id) = rand.choice(threads[article_id])
+            if parent_depth < reply_depth:
+                parent_posting_ref_id = parent_ref_id
+                depth = parent_depth + 1
+        threads[article_id].append((depth, posting_ref_id))
+        if len(threads[article_id]) > 200:
+            threads[article_id].pop(0)
+
+        # few users write most postings, raters are drawn uniformly
+        raters = rand.sample(
+            range(2, users + 1), min(users - 1, int(rand.expovariate(1 / ratings)))
+        )
+        positive = [rand.random() < 0.6 for _ in raters]
+        posting_rows.append(
+            {
+                "posting_id": posting_id,
+                "article_id": article_id,
+                "user_id": 1
+                if rand.random() < 0.01
+                else min(users, int(rand.paretovariate(1.2)) + 1),
+                "posting_ref_id": posting_ref_id,
+                "parent_posting_ref_id": parent_posting_ref_id,
+                # postings get rarer the older the article gets
+                "posting_date": publication_dates[article_id]
+                + datetime.timedelta(minutes=int(rand.expovariate(1 / 600))),
+                "positive_rating": sum(positive),
+                "negative_rating": len(positive) - sum(positive),
+                "posting_title": get_text(rand, 1, 1) if rand.random() < 0.5 else "",
+                "posting_content": get_text(rand),
+            }
+        )
+        rating_rows += [
+            {"posting_id": posting_id, "user_id": user_id, "positive": p}
+            for (user_id, p) in zip(raters, positive)
+        ]
+        if len(posting_rows) >= 10000:
+            session.execute(Posting.__table__.insert(), posting_rows)
+            if rating_rows:
+                session.execute(PostingRating.__table__.insert(), rating_rows)
+            (posting_rows, rating_rows) = ([], [])
+    if posting_rows:
+        session.execute(Posting.__table__.insert(), posting_rows)
+    if rating_rows:
+        session.execute(PostingRating.__table__.insert(), rating_rows)
+    session.commit()
+    return session
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    create_synthetic_db(
+        args.db,
+        args.articles,
+        args.users,
+        args.postings,
+        args.ratings,
+        args.reply_depth,
+        args.reply_share,
+        args.seed,
+        args.force,
+    ).close()
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# the scripts are imported as top level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_session  # noqa: E402
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = get_db_session(db_url=f"sqlite:///{tmp_path / 'postings.db'}")
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def synthetic_session(tmp_path):
+    from synthetic import create_synthetic_db
+
+    session = create_synthetic_db(
+        str(tmp_path / "synthetic.db"), articles=5, users=60, postings=600, seed=1
+    )
+    yield session
+    session.close()
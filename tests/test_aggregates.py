@@ -0,0 +1,30 @@
+from aggregates import get_article_stats, get_user_stats
+from benchmark import get_posting_stats_per_article
+from db import Article
+
+
+def test_article_stats_match_per_article_queries(synthetic_session):
+    session = synthetic_session
+    stats = get_article_stats(session).set_index("article_id")
+    for (article_id,) in session.query(Article.article_id):
+        (user_stats, user_count, positive_ratings, negative_ratings) = (
+            get_posting_stats_per_article(session, article_id)
+        )
+        row = stats.loc[article_id]
+        assert row["interacting_user_count"] == user_count
+        assert row["positive_ratings"] == positive_ratings
+        assert row["negative_ratings"] == negative_ratings
+        assert row["posting_count"] == sum(x[1] for x in user_stats)
+
+
+def test_user_stats_match_per_article_queries(synthetic_session):
+    session = synthetic_session
+    user_stats = get_user_stats(session)
+    for (article_id,) in session.query(Article.article_id):
+        expected = get_posting_stats_per_article(session, article_id)[0]
+        article_user_stats = user_stats[user_stats["article_id"] == article_id]
+        assert sorted(
+            article_user_stats[
+                ["user_name", "posting_count", "positive_ratings", "negative_ratings"]
+            ].itertuples(index=False, name=None)
+        ) == sorted(expected)
@@ -0,0 +1,103 @@
+from collections import Counter
+
+from db import Posting
+from entity_index import (
+    clear_index,
+    co_occurring_entities,
+    find_candidate_posting_ids,
+    find_postings,
+    normalize_entity,
+    top_entities,
+    update_index,
+)
+from synthetic import ENTITIES
+
+
+class StubEntity:
+    def __init__(self, text):
+        self.text = text
+        self.label_ = "ORG" if text.isupper() else "LOC"
+
+
+class StubDoc:
+    def __init__(self, text):
+        words = [word.strip(".!?") for word in text.split()]
+        self.ents = [StubEntity(word) for word in words if word in ENTITIES]
+        # entities consisting of stripped characters only are skipped by the index
+        self.ents.append(StubEntity("-"))
+
+
+class StubNlp:
+    # stands in for spaCy, entities are the synthetic generator's entity words
+    def pipe(self, texts, batch_size=64, disable=()):
+        return (StubDoc(text) for text in texts)
+
+
+def get_expected_mentions(session, entity_text):
+    mentions = {}
+    for (posting_id, article_id, title, content) in session.query(
+        Posting.posting_id,
+        Posting.article_id,
+        Posting.posting_title,
+        Posting.posting_content,
+    ):
+        count = sum(
+            normalize_entity(ent.text) == entity_text
+            for ent in StubDoc((title or "") + "\n" + content).ents
+        )
+        if count:
+            mentions[posting_id] = (article_id, count)
+    return mentions
+
+
+def test_find_postings(synthetic_session):
+    session = synthetic_session
+    assert update_index(session, StubNlp(), chunk_size=100) == 600
+    expected = get_expected_mentions(session, "fpö")
+    assert expected
+    assert {
+        posting_id: (article_id, count)
+        for (posting_id, article_id, count) in find_postings(session, "FPÖ")
+    } == expected
+    assert [x[0] for x in find_postings(session, "fpö", article_id=1)] == sorted(
+        posting_id
+        for (posting_id, (article_id, _)) in expected.items()
+        if article_id == 1
+    )
+    assert find_candidate_posting_ids(session, ["fpö"], 1) == {
+        posting_id for (posting_id, (article_id, _)) in expected.items() if article_id == 1
+    }
+
+
+def test_incremental_update_equals_rebuild(synthetic_session):
+    session = synthetic_session
+    update_index(session, StubNlp(), chunk_size=250)
+    assert update_index(session, StubNlp()) == 0
+    incremental = top_entities(session, 1, limit=100)
+    clear_index(session)
+    update_index(session, StubNlp(), chunk_size=1000)
+    assert top_entities(session, 1, limit=100) == incremental
+
+
+def test_top_and_co_occurring_entities(synthetic_session):
+    session = synthetic_session
+    update_index(session, StubNlp())
+    top = top_entities(session, 2, limit=100)
+    assert "" not in {entity_text for (entity_text, _, _, _) in top}
+    counts = Counter()
+    for (posting_id, (article_id, count)) in get_expected_mentions(session, "kickl").items():
+        if article_id == 2:
+            counts["postings"] += 1
+            counts["mentions"] += count
+    assert ("kickl", "LOC", counts["postings"], counts["mentions"]) in top
+
+    co_occurring = dict(
+        (entity_text, posting_count)
+        for (entity_text, _, posting_count) in co_occurring_entities(
+            session, "kickl", limit=100
+        )
+    )
+    kickl_postings = set(get_expected_mentions(session, "kickl"))
+    strache_postings = set(get_expected_mentions(session, "strache"))
+    assert "kickl" not in co_occurring
+    assert co_occurring["strache"] == len(kickl_postings & strache_postings)
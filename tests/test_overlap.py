@@ -0,0 +1,70 @@
+import datetime
+
+import numpy as np
+
+from db import Article, Posting, PostingRating, User, DELETED_USER
+from overlap import get_audience_overlap
+
+
+def add_db(session):
+    """
+    Three articles, audiences {alice, bob}, {alice, bob, carol} and {carol}.
+    The deleted user is active in articles 1 and 3, but mustn't connect them.
+    """
+    date = datetime.datetime(2020, 1, 1, 10, 0, 0)
+    articles = [Article(f"title {i}", f"url {i}", date) for i in range(3)]
+    users = {
+        name: User(name, False) for name in ["alice", "bob", "carol", DELETED_USER]
+    }
+    session.add_all(articles + list(users.values()))
+    session.commit()
+
+    def add_posting(article, user_name, rater_names):
+        posting = Posting(
+            article.article_id, users[user_name].user_id, user_name, None, date, 0, 0, "", ""
+        )
+        session.add(posting)
+        session.commit()
+        for rater_name in rater_names:
+            rating = PostingRating(True)
+            rating.posting_id = posting.posting_id
+            rating.user_id = users[rater_name].user_id
+            session.add(rating)
+        session.commit()
+
+    add_posting(articles[0], "alice", ["bob"])
+    add_posting(articles[0], DELETED_USER, [])
+    add_posting(articles[1], "bob", ["alice", "carol"])
+    add_posting(articles[1], "alice", [])
+    add_posting(articles[2], "carol", [DELETED_USER])
+    return [article.article_id for article in articles]
+
+
+def test_audience_overlap(session):
+    article_ids = add_db(session)
+    (shared, jaccard, user_activity) = get_audience_overlap(session)
+
+    assert shared.index.tolist() == article_ids
+    assert shared.values.tolist() == [[2, 2, 0], [2, 3, 1], [0, 1, 1]]
+    np.testing.assert_allclose(
+        jaccard.values, [[1, 2 / 3, 0], [2 / 3, 1, 1 / 3], [0, 1 / 3, 1]]
+    )
+
+    user_activity = user_activity.set_index("user_name")
+    assert DELETED_USER not in user_activity.index
+    assert user_activity.loc["alice"].tolist()[1:] == [2, 2, 1]
+    assert user_activity.loc["bob"].tolist()[1:] == [2, 1, 1]
+    assert user_activity.loc["carol"].tolist()[1:] == [2, 1, 1]
+
+
+def test_audience_overlap_of_selected_articles(session):
+    article_ids = add_db(session)
+    (shared, jaccard, user_activity) = get_audience_overlap(session, article_ids[1:])
+
+    assert shared.values.tolist() == [[3, 1], [1, 1]]
+    np.testing.assert_allclose(jaccard.values, [[1, 1 / 3], [1 / 3, 1]])
+    assert user_activity.set_index("user_name")["article_count"].to_dict() == {
+        "alice": 1,
+        "bob": 1,
+        "carol": 2,
+    }
@@ -0,0 +1,100 @@
+import datetime
+
+from sqlalchemy import func, text
+
+from aggregates import get_article_stats
+from db import ArticleSummary, Posting, PostingRating, UserSummary
+from summaries import get_article_summaries, refresh_summaries
+
+
+def get_summary_rows(session):
+    return (
+        sorted(tuple(row) for row in session.execute(text("SELECT * FROM article_summaries"))),
+        sorted(tuple(row) for row in session.execute(text("SELECT * FROM user_summaries"))),
+    )
+
+
+def test_refresh_matches_aggregates(synthetic_session):
+    session = synthetic_session
+    refresh_summaries(session)
+    summaries = get_article_summaries(session).set_index("article_id")
+    stats = get_article_stats(session).set_index("article_id")
+    for column in ["posting_count", "positive_ratings", "negative_ratings", "rating_count"]:
+        assert summaries[column].tolist() == stats[column].tolist()
+    assert summaries["rater_count"].tolist() == stats["rating_user_count"].tolist()
+    assert (summaries["first_posting_date"] == stats["first_posting_date"]).all()
+    assert (summaries["last_posting_date"] == stats["last_posting_date"]).all()
+
+
+def test_user_rater_count(synthetic_session):
+    session = synthetic_session
+    refresh_summaries(session)
+    expected = dict(
+        session.query(Posting.user_id, func.count(func.distinct(PostingRating.user_id)))
+        .filter(PostingRating.posting_id == Posting.posting_id)
+        .group_by(Posting.user_id)
+    )
+    rater_counts = dict(
+        session.query(UserSummary.user_id, UserSummary.rater_count).filter(
+            UserSummary.rater_count > 0
+        )
+    )
+    assert rater_counts == expected
+
+
+def test_incremental_refresh_equals_full_refresh(synthetic_session):
+    session = synthetic_session
+    # hold back the newest postings and their ratings, then add them after a first refresh
+    postings = [
+        dict(row)
+        for row in session.execute(
+            Posting.__table__.select().where(Posting.posting_id > 400)
+        )
+    ]
+    ratings = [
+        dict(row)
+        for row in session.execute(
+            PostingRating.__table__.select().where(PostingRating.posting_id > 400)
+        )
+    ]
+    session.execute(text("DELETE FROM posting_ratings WHERE posting_id > 400"))
+    session.execute(text("DELETE FROM postings WHERE posting_id > 400"))
+    session.commit()
+    assert refresh_summaries(session)[0] == 400
+
+    session.execute(Posting.__table__.insert(), postings)
+    session.execute(PostingRating.__table__.insert(), ratings)
+    session.commit()
+    assert refresh_summaries(session) == (len(postings), len(ratings))
+    incremental = get_summary_rows(session)
+
+    refresh_summaries(session, full=True)
+    assert get_summary_rows(session) == incremental
+
+
+def test_refresh_returns_added_rows(synthetic_session):
+    session = synthetic_session
+    rating_count = session.query(func.count()).select_from(PostingRating).scalar()
+    assert refresh_summaries(session) == (600, rating_count)
+    assert refresh_summaries(session) == (0, 0)
+
+    # gaps in posting ids don't count as postings
+    session.execute(
+        Posting.__table__.insert(),
+        {
+            "posting_id": 5000,
+            "article_id": 1,
+            "user_id": 2,
+            "posting_ref_id": "5000",
+            "posting_date": datetime.datetime(2020, 2, 1),
+            "negative_rating": 0,
+            "positive_rating": 0,
+            "posting_title": "",
+            "posting_content": "",
+        },
+    )
+    session.commit()
+    assert refresh_summaries(session) == (1, 0)
+    assert session.query(ArticleSummary).get(1).posting_count == session.query(
+        func.count(Posting.posting_id)
+    ).filter(Posting.article_id == 1).scalar()
@@ -0,0 +1,45 @@
+import datetime
+
+from db import Article, Posting
+from timeseries import get_posting_rate
+
+
+def add_postings(session, publication_date, offsets):
+    article = Article("title", "url", publication_date)
+    session.add(article)
+    session.commit()
+    session.add_all(
+        Posting(
+            article.article_id, 1, str(i), None, publication_date + offset, 0, 0, "", ""
+        )
+        for (i, offset) in enumerate(offsets)
+    )
+    session.commit()
+
+
+def test_postings_on_bucket_boundaries(session):
+    publication_date = datetime.datetime(2020, 1, 1, 10, 0, 0)
+    add_postings(
+        session,
+        publication_date,
+        [datetime.timedelta(minutes=m) for m in range(0, 3000, 7)],
+    )
+    df = get_posting_rate(session, resolution="minute", since_publication=True)
+    assert df["bucket"].tolist() == list(range(0, 3000, 7))
+    assert (df["posting_count"] == 1).all()
+
+
+def test_postings_just_before_a_boundary(session):
+    publication_date = datetime.datetime(2020, 1, 1, 10, 0, 0)
+    add_postings(
+        session,
+        publication_date,
+        [
+            datetime.timedelta(seconds=3599),
+            datetime.timedelta(seconds=3600),
+            datetime.timedelta(seconds=7199),
+        ],
+    )
+    df = get_posting_rate(session, resolution="hour", since_publication=True)
+    assert df["bucket"].tolist() == [0, 1]
+    assert df["posting_count"].tolist() == [1, 2]
@@ -0,0 +1,102 @@
+import pandas as pd
+
+# db
+from sqlalchemy import Integer, cast, func
+
+# project specific
+from db import Article, Posting
+
+# seconds and sqlite strftime format per resolution
+RESOLUTIONS = {
+    "minute": (60, "%Y-%m-%d %H:%M:00"),
+    "hour": (3600, "%Y-%m-%d %H:00:00"),
+    "day": (86400, "%Y-%m-%d 00:00:00"),
+}
+
+
+def get_posting_rate(
+    session, article_ids=None, resolution="hour", since_publication=False
+):
+    """
+    Postings, received ratings and posting users per article and time bucket, grouped by sqlite.
+    Buckets are either points in time or, with since_publication, the number of minutes, hours
+    or days since the article's publication. Ratings aren't timestamped, so they're counted
+    in the bucket of the rated posting. Buckets without postings are left out.
+    """
+    (seconds, time_format) = RESOLUTIONS[resolution]
+    if since_publication:
+        # whole seconds in integer arithmetic, julianday's floats put postings exactly on a
+        # bucket's boundary into the previous bucket
+        bucket = (
+            cast(func.strftime("%s", Posting.posting_date), Integer)
+            - cast(func.strftime("%s", Article.article_publication_date), Integer)
+        ) / seconds
+    else:
+        bucket = func.strftime(time_format, Posting.posting_date)
+    query = (
+        session.query(
+            Posting.article_id,
+            bucket,
+            func.count(Posting.posting_id),
+            func.sum(Posting.positive_rating),
+            func.sum(Posting.negative_rating),
+            func.count(func.distinct(Posting.user_id)),
+        )
+        .filter(Posting.article_id == Article.article_id)
+        .group_by(Posting.article_id, bucket)
+        .order_by(Posting.article_id, bucket)
+    )
+    if article_ids is not None:
+        query = query.filter(Posting.article_id.in_(article_ids))
+    df = pd.DataFrame(
+        query.all(),
+        columns=[
+            "article_id",
+            "bucket",
+            "posting_count",
+            "positive_ratings",
+            "negative_ratings",
+            "user_count",
+        ],
+    ).astype(
+        {
+            "article_id": "int64",
+            "bucket": "int64" if since_publication else "datetime64[ns]",
+            "posting_count": "int64",
+            "positive_ratings": "int64",
+            "negative_ratings": "int64",
+            "user_count": "int64",
+        }
+    )
+    df["cumulative_posting_count"] = df.groupby("article_id")["posting_count"].cumsum()
+    return df
+
+
+def get_posting_time_summary(session, article_ids=None):
+    """
+    Posting count, first, last and mean posting date per article.
+    """
+    query = session.query(
+        Posting.article_id,
+        func.count(Posting.posting_id),
+        func.min(Posting.posting_date),
+        func.max(Posting.posting_date),
+        func.avg(func.julianday(Posting.posting_date)),
+    ).group_by(Posting.article_id)
+    if article_ids is not None:
+        query = query.filter(Posting.article_id.in_(article_ids))
+    df = pd.DataFrame(
+        query.all(),
+        columns=["article_id", "posting_count", "first", "last", "mean"],
+    )
+    # julian day of the unix epoch
+    df["mean"] = pd.to_datetime(df["mean"] - 2440587.5, unit="D")
+    return df.astype(
+        {
+            "article_id": "int64",
+            "posting_count": "int64",
+            "first": "datetime64[ns]",
+            "last": "datetime64[ns]",
+            "mean": "datetime64[ns]",
+        }
+    )